@@ -2,7 +2,7 @@
 import { Injectable, Inject, Optional } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { DOCUMENT } from '@angular/common';
-import { Observable, forkJoin, map } from 'rxjs';
+import { Observable, catchError, forkJoin, map } from 'rxjs';
 import * as Papa from 'papaparse';
 
 export interface DataRow {
@@ -30,12 +30,70 @@ interface CsvRow {
   'Русский_%': string;
 }
 
+// Счётчики по источникам, группам и месяцам; категории - номера в dimensions
+export interface ResultsCube {
+  source: number[];
+  group: number[];
+  year: number[];
+  month: number[];  // 0 - месяц неизвестен
+  type: number[];
+  a: number[];
+  b: number[];
+  c: number[];
+}
+
+// results_bundle.json, собирается src/results_bundle.py
+interface ResultsBundle {
+  format: string;
+  version: number;
+  dimensions: {
+    source: DataRow['source'][];
+    type: string[];
+    year: number[];
+    group: string[];
+  };
+  rows: {
+    source: number[];
+    year: number[];
+    type: number[];
+    total: number[];
+    tuvanNguCol: number[];
+    tuvanNguPercent: number[];
+    tuvanRusCol: number[];
+    tuvanRusPercent: number[];
+    russianCol: number[];
+    russianPercent: number[];
+  };
+  indexes: {
+    year: Record<string, number[]>;
+    type: Record<string, number[]>;
+    source: Record<string, number[]>;
+  };
+  cube: ResultsCube;
+}
+
+interface RowIndex {
+  rows: DataRow[];
+  year: Record<string, number[]>;
+  type: Record<string, number[]>;
+  source: Record<string, number[]>;
+}
+
 @Injectable({
   providedIn: 'root'
 })
 export class CsvDataService {
   private readonly basePath: string;
 
+  private readonly BUNDLE_FILE = 'assets/results_bundle.json';
+  private readonly BUNDLE_FORMAT = 'tuvan-results-bundle';
+  private readonly BUNDLE_VERSION = 1;
+
+  // Заполняются при загрузке из results_bundle.json
+  private rowIndex: RowIndex | null = null;
+  private bundleCube: ResultsCube | null = null;
+  private bundleGroups: string[] = [];
+
   private readonly CSV_FILES = [
     { path: 'assets/results_community_media_posts.csv', source: 'community' as const },
     { path: 'assets/results_gov_institutions_posts.csv', source: 'government' as const },
@@ -60,6 +118,58 @@ export class CsvDataService {
   }
 
   loadAllData(): Observable<DataRow[]> {
+    // Один запрос к готовому файлу, три CSV - если его нет или версия другая
+    return this.http.get<ResultsBundle>(this.getFullPath(this.BUNDLE_FILE)).pipe(
+      map(bundle => this.readBundle(bundle)),
+      catchError(error => {
+        console.warn('results_bundle.json недоступен, загружаем CSV:', error);
+        this.rowIndex = null;
+        this.bundleCube = null;
+        this.bundleGroups = [];
+        return this.loadCsvData();
+      })
+    );
+  }
+
+  private readBundle(bundle: ResultsBundle): DataRow[] {
+    if (bundle.format !== this.BUNDLE_FORMAT || bundle.version !== this.BUNDLE_VERSION) {
+      throw new Error(`Неподдерживаемая версия results_bundle.json: ${bundle.version}`);
+    }
+
+    // Значения уже числовые, остаётся собрать объекты строк из колонок
+    const { rows, dimensions } = bundle;
+    const data: DataRow[] = new Array(rows.year.length);
+    for (let i = 0; i < data.length; i++) {
+      data[i] = {
+        year: rows.year[i],
+        type: dimensions.type[rows.type[i]],
+        total: rows.total[i],
+        tuvanNguCol: rows.tuvanNguCol[i],
+        tuvanNguPercent: rows.tuvanNguPercent[i],
+        tuvanRusCol: rows.tuvanRusCol[i],
+        tuvanRusPercent: rows.tuvanRusPercent[i],
+        russianCol: rows.russianCol[i],
+        russianPercent: rows.russianPercent[i],
+        source: dimensions.source[rows.source[i]]
+      };
+    }
+
+    this.rowIndex = { rows: data, ...bundle.indexes };
+    this.bundleCube = bundle.cube;
+    this.bundleGroups = dimensions.group;
+    return data;
+  }
+
+  // Счётчики по группам и месяцам, только при загрузке из results_bundle.json
+  getCube(): ResultsCube | null {
+    return this.bundleCube;
+  }
+
+  getGroups(): string[] {
+    return this.bundleGroups;
+  }
+
+  private loadCsvData(): Observable<DataRow[]> {
     const requests = this.CSV_FILES.map(file =>
       this.loadCsvFile(this.getFullPath(file.path), file.source)
     );
@@ -118,6 +228,10 @@ export class CsvDataService {
     types: string[],
     sources: DataRow['source'][]
   ): DataRow[] {
+    if (this.rowIndex && this.rowIndex.rows === data) {
+      return this.filterIndexed(this.rowIndex, years, types, sources);
+    }
+
     return data.filter(row => {
       const yearMatch = years.length === 0 || years.includes(row.year);
       const typeMatch = types.length === 0 || types.includes(row.type);
@@ -126,6 +240,41 @@ export class CsvDataService {
     });
   }
 
+  private filterIndexed(
+    index: RowIndex,
+    years: number[],
+    types: string[],
+    sources: DataRow['source'][]
+  ): DataRow[] {
+    // Кандидаты - строки самого узкого выбранного измерения из готовых индексов,
+    // остальные измерения проверяются только у них
+    const selections = [
+      { values: years.map(String), postings: index.year },
+      { values: types, postings: index.type },
+      { values: sources as string[], postings: index.source }
+    ].filter(selection => selection.values.length > 0);
+
+    if (selections.length === 0) {
+      return index.rows.slice();
+    }
+
+    const candidates = selections
+      .map(selection => selection.values.flatMap(value => selection.postings[value] ?? []))
+      .reduce((smallest, rows) => (rows.length < smallest.length ? rows : smallest));
+
+    const yearSet = new Set(years);
+    const typeSet = new Set(types);
+    const sourceSet = new Set(sources);
+    return candidates
+      .sort((a, b) => a - b)
+      .map(i => index.rows[i])
+      .filter(row =>
+        (yearSet.size === 0 || yearSet.has(row.year)) &&
+        (typeSet.size === 0 || typeSet.has(row.type)) &&
+        (sourceSet.size === 0 || sourceSet.has(row.source))
+      );
+  }
+
   getUniqueYears(data: DataRow[]): number[] {
     return [...new Set(data.map(row => row.year))].sort();
   }
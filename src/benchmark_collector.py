@@ -0,0 +1,220 @@
+"""Measures collector throughput against the offline fake VK API.
+
+Starts fake_vk_api.py in-process, runs get_posts.main() on synthetic groups
+in a temporary directory and reports requests/s, records/s and wall time:
+
+    python benchmark_collector.py --groups 6 --posts 500 --tokens 2
+
+With --compare-transport it instead times single 100-post `wall.get` pages
+through the collector's original transport (default connector, a timeout
+object per request, `resp.json()`) and the tuned one (create_session(),
+decode_json()):
+
+    python benchmark_collector.py --compare-transport --pages 500 --latency 0
+"""
+import aiohttp
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import get_posts
+from checkpoint import CrawlCheckpoint
+from metrics import CrawlMetrics
+from fake_vk_api import FakeVKServer, SyntheticWalls, start_server
+
+
+async def run_benchmark(args):
+    server = FakeVKServer(
+        walls=SyntheticWalls(
+            args.posts, args.max_comments, args.new_posts_per_minute, args.deleted_posts_per_minute
+        ),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.server_rate_limit,
+    )
+    runner, api_url = await start_server(server)
+
+    get_posts.API_URL = api_url
+    get_posts.token_pool = get_posts.TokenPool(
+        [f"bench-token-{i}" for i in range(args.tokens)], args.rate, args.burst
+    )
+    get_posts.metrics = CrawlMetrics()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        categories = {
+            "Benchmark": {
+                "groups": [f"bench_group_{i}" for i in range(args.groups)],
+                "output": os.path.join(work_dir, "benchmark_posts.csv"),
+            }
+        }
+        checkpoint = CrawlCheckpoint(os.path.join(work_dir, "crawl_state.sqlite"))
+        log = sys.stdout if args.verbose else open(os.devnull, "w")
+        try:
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            with contextlib.redirect_stdout(log):
+                await get_posts.main(
+                    checkpoint, False, args.format, args.layout, categories,
+                    full_threads=args.full_threads, sample_per_year=args.sample_per_year,
+                )
+            wall_time = time.perf_counter() - started
+            cpu_time = time.process_time() - cpu_started
+            posts, comments = checkpoint.counts()
+        finally:
+            checkpoint.close()
+            if log is not sys.stdout:
+                log.close()
+            await runner.cleanup()
+
+    requests = server.stats["requests"]
+    records = posts + comments
+    return {
+        "groups": args.groups,
+        "tokens": args.tokens,
+        "wall_time_s": round(wall_time, 3),
+        "cpu_time_s": round(cpu_time, 3),
+        "requests": requests,
+        "api_calls": server.stats["calls"],
+        "throttled": server.stats["throttled"],
+        "bytes_received": server.stats["bytes_sent"],
+        "requests_per_s": round(requests / wall_time, 2),
+        "calls_per_request": round(server.stats["calls"] / max(requests, 1), 2),
+        "posts": posts,
+        "comments": comments,
+        "records_per_s": round(records / wall_time, 1),
+        "blocked_s": {
+            reason: round(seconds, 3)
+            for reason, seconds in get_posts.metrics.blocked_seconds.items()
+        },
+        "request_latency_s": {
+            endpoint: histogram.to_dict()
+            for endpoint, histogram in get_posts.metrics.request_latency.items()
+        },
+    }
+
+
+async def time_pages(session, url, pages, posts, tuned):
+    """Requests `pages` wall.get pages one by one, returns per-page averages"""
+    latency = cpu = decode_cpu = size = 0.0
+    for i in range(pages):
+        params = {"domain": f"bench_group_{i % 10}", "count": 100, "offset": i * 100 % max(posts, 100)}
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        if tuned:
+            async with session.get(url, params=params, timeout=get_posts.REQUEST_TIMEOUT) as resp:
+                body = await resp.read()
+                decode_started = time.process_time()
+                get_posts.decode_json(body)
+        else:
+            timeout = aiohttp.ClientTimeout(total=30)
+            async with session.get(url, params=params, timeout=timeout) as resp:
+                body = await resp.read()
+                decode_started = time.process_time()
+                await resp.json()
+        decode_cpu += time.process_time() - decode_started
+        cpu += time.process_time() - cpu_started
+        latency += time.perf_counter() - started
+        size += len(body)
+    return {
+        "latency_ms": round(latency / pages * 1000, 3),
+        "cpu_ms": round(cpu / pages * 1000, 3),
+        "decode_cpu_ms": round(decode_cpu / pages * 1000, 3),
+        "page_bytes": int(size / pages),
+    }
+
+
+async def compare_transport(args):
+    """Times the original and the tuned transport on the same pages of the fake API"""
+    server = FakeVKServer(
+        walls=SyntheticWalls(args.posts, args.max_comments),
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=0,
+    )
+    runner, api_url = await start_server(server)
+    url = f"{api_url}/wall.get"
+    result = {"pages": args.pages, "orjson": get_posts.orjson is not None}
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1800)) as session:
+            await time_pages(session, url, 10, args.posts, tuned=False)  # warm-up
+            result["original"] = await time_pages(session, url, args.pages, args.posts, tuned=False)
+        async with get_posts.create_session() as session:
+            await time_pages(session, url, 10, args.posts, tuned=True)
+            result["tuned"] = await time_pages(session, url, args.pages, args.posts, tuned=True)
+    finally:
+        await runner.cleanup()
+    return result
+
+
+def print_transport_report(result):
+    print(f"📄 {result['pages']} wall.get pages, orjson {'on' if result['orjson'] else 'not installed'}")
+    for name in ("original", "tuned"):
+        page = result[name]
+        print(f"   {name:>8}: {page['latency_ms']} ms per page, CPU {page['cpu_ms']} ms "
+              f"(decoding {page['decode_cpu_ms']} ms), {page['page_bytes']} bytes")
+    original, tuned = result["original"], result["tuned"]
+    print(f"💡 Saved per page: {original['latency_ms'] - tuned['latency_ms']:.3f} ms latency, "
+          f"{original['cpu_ms'] - tuned['cpu_ms']:.3f} ms CPU "
+          f"({original['decode_cpu_ms'] - tuned['decode_cpu_ms']:.3f} ms of it decoding)")
+
+
+def print_report(result):
+    print(f"⏱️ Wall time: {result['wall_time_s']} s (CPU {result['cpu_time_s']} s)")
+    print(f"📡 Requests: {result['requests']} ({result['requests_per_s']} req/s), "
+          f"{result['api_calls']} API calls ({result['calls_per_request']} per request), "
+          f"{result['throttled']} throttled")
+    print(f"📦 Records: {result['posts']} posts + {result['comments']} comments "
+          f"({result['records_per_s']} records/s), {result['bytes_received']} bytes received")
+    for endpoint, latency in result["request_latency_s"].items():
+        print(f"🕒 {endpoint}: mean {latency['mean']} s, p50 ≤ {latency['p50']} s, p95 ≤ {latency['p95']} s")
+    blocked = ", ".join(f"{reason} {seconds} s" for reason, seconds in result["blocked_s"].items())
+    print(f"🚦 Blocked: {blocked or 'never'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks get_posts.py against the fake VK API")
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--posts", type=int, default=300, help="posts per group")
+    parser.add_argument("--max-comments", type=int, default=30, help="maximum comments per post")
+    parser.add_argument("--new-posts-per-minute", type=float, default=0,
+                        help="posts published on every wall during the crawl")
+    parser.add_argument("--deleted-posts-per-minute", type=float, default=0,
+                        help="posts deleted from every wall during the crawl")
+    parser.add_argument("--tokens", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=get_posts.MAX_REQUESTS_PER_SECOND,
+                        help="collector requests per second per token")
+    parser.add_argument("--burst", type=int, default=get_posts.RATE_LIMIT_BURST)
+    parser.add_argument("--server-rate-limit", type=float, default=3.0,
+                        help="fake API requests per second per token before error 6 (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="parquet")
+    parser.add_argument("--layout", choices=["flat", "normalized"], default="normalized")
+    parser.add_argument("--full-threads", action="store_true",
+                        help="collect every comment and reply")
+    parser.add_argument("--sample-per-year", type=int, metavar="N",
+                        help="collect a year-stratified sample of N posts per year")
+    parser.add_argument("--compare-transport", action="store_true",
+                        help="compare the original and the tuned HTTP transport instead of crawling")
+    parser.add_argument("--pages", type=int, default=300, help="pages per transport with --compare-transport")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the collector output")
+    args = parser.parse_args()
+
+    if args.compare_transport:
+        result = asyncio.run(compare_transport(args))
+        report = print_transport_report
+    else:
+        result = asyncio.run(run_benchmark(args))
+        report = print_report
+    if args.json:
+        print(json.dumps(result))
+    else:
+        report(result)
@@ -0,0 +1,403 @@
+import sqlite3
+import time
+from constants import CHECKPOINT_BUSY_TIMEOUT, GROUP_MAX_ATTEMPTS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    incremental INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    group_name TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    next_offset INTEGER NOT NULL DEFAULT 0,
+    posts_done INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    known_post_id INTEGER,
+    known_post_date INTEGER,
+    anchor_post_id INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    -- Stored posts and comments are from the previous full run
+    stale INTEGER NOT NULL DEFAULT 0
+);
+
+-- Screen name -> owner_id cache, kept across runs
+CREATE TABLE IF NOT EXISTS owner_ids (
+    group_name TEXT PRIMARY KEY,
+    owner_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS posts (
+    group_name TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    text TEXT,
+    likes INTEGER,
+    comments_count INTEGER,
+    date_unix INTEGER,
+    comments_done INTEGER NOT NULL DEFAULT 0,
+    comments_offset INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_name, post_id)
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    group_name TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    comment_id INTEGER NOT NULL,
+    text TEXT,
+    likes INTEGER,
+    date_unix INTEGER,
+    parent_id INTEGER,
+    PRIMARY KEY (group_name, post_id, comment_id)
+);
+"""
+
+# Columns added after the first release, created on stores that predate them
+MIGRATIONS = [
+    ("posts", "comments_offset", "INTEGER NOT NULL DEFAULT 0"),
+    ("comments", "parent_id", "INTEGER"),
+    ("groups", "anchor_post_id", "INTEGER"),
+    ("groups", "attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("groups", "failed", "INTEGER NOT NULL DEFAULT 0"),
+    ("groups", "stale", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+class CrawlCheckpoint:
+    """SQLite store with everything a crawl has fetched so far.
+
+    Every page of posts and every comment list is committed as soon as it
+    arrives, together with the `wall.get` offset and anchor post of its group, so an
+    interrupted run can continue exactly where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Scheduler workers in other processes write to the same store
+        self.conn = sqlite3.connect(path, timeout=CHECKPOINT_BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        for table, column, definition in MIGRATIONS:
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, incremental=False):
+        """Resumes the unfinished run if there is one, otherwise starts a new one.
+
+        A new full run replaces the stored posts and comments of each group
+        once its first page arrives, so a run that fetches nothing keeps the
+        previous data; a new incremental run keeps them and only resets the
+        per-group progress.
+        Returns (resumed, incremental); a resumed run keeps its original mode.
+        Groups that can never be collected are marked failed instead of keeping
+        the run unfinished, so a later call starts the requested new run.
+        """
+        row = self.conn.execute(
+            "SELECT incremental FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            return True, bool(row[0])
+
+        with self.conn:
+            if incremental:
+                # Remember where the stored wall ends, so paging can stop there
+                self.conn.execute(
+                    """
+                    UPDATE groups SET
+                        next_offset = 0, posts_done = 0, completed = 0, anchor_post_id = NULL,
+                        attempts = 0, failed = 0, stale = 0,
+                        known_post_id = (SELECT MAX(post_id) FROM posts WHERE posts.group_name = groups.group_name),
+                        known_post_date = (SELECT MAX(date_unix) FROM posts WHERE posts.group_name = groups.group_name)
+                    """
+                )
+            else:
+                self.conn.execute(
+                    """
+                    UPDATE groups SET
+                        next_offset = 0, posts_done = 0, completed = 0, anchor_post_id = NULL,
+                        attempts = 0, failed = 0, known_post_id = NULL, known_post_date = NULL,
+                        stale = 1
+                    """
+                )
+            self.conn.execute(
+                "INSERT INTO runs (started_at, incremental) VALUES (?, ?)",
+                (int(time.time()), int(incremental)),
+            )
+        return False, incremental
+
+    def finish_run(self):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE runs SET finished_at = ? WHERE finished_at IS NULL", (int(time.time()),)
+            )
+
+    def group_progress(self, category, group_name):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO groups (group_name, category) VALUES (?, ?)",
+                (group_name, category),
+            )
+        row = self.conn.execute(
+            """
+            SELECT next_offset, anchor_post_id, posts_done, completed, failed, known_post_id, known_post_date
+            FROM groups WHERE group_name = ?
+            """,
+            (group_name,),
+        ).fetchone()
+        next_offset, anchor_post_id, posts_done, completed, failed, known_post_id, known_post_date = row
+        return {
+            "next_offset": next_offset,
+            "anchor_post_id": anchor_post_id,
+            "posts_done": bool(posts_done),
+            "completed": bool(completed),
+            "failed": bool(failed),
+            "known_post_id": known_post_id,
+            "known_post_date": known_post_date,
+        }
+
+    def cached_owner_ids(self, group_names):
+        wanted = set(group_names)
+        rows = self.conn.execute("SELECT group_name, owner_id FROM owner_ids")
+        return {name: owner_id for name, owner_id in rows if name in wanted}
+
+    def cache_owner_ids(self, owner_ids):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO owner_ids (group_name, owner_id) VALUES (?, ?)",
+                owner_ids.items(),
+            )
+
+    def save_posts_page(self, category, group_name, posts, next_offset, anchor_post_id=None):
+        """Stores one `wall.get` page and where the next one starts in a single transaction"""
+        rows = [
+            (
+                group_name,
+                post["id"],
+                category,
+                post.get("text", ""),
+                post.get("likes", {}).get("count", 0),
+                post.get("comments", {}).get("count", 0),
+                post.get("date", 0),
+            )
+            for post in posts
+        ]
+        with self.conn:
+            self._drop_stale_rows(group_name)
+            self.conn.executemany(
+                """
+                INSERT INTO posts (group_name, post_id, category, text, likes, comments_count, date_unix)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (group_name, post_id) DO UPDATE SET
+                    text = excluded.text,
+                    likes = excluded.likes,
+                    comments_count = excluded.comments_count,
+                    comments_done = CASE
+                        WHEN posts.comments_count = excluded.comments_count THEN posts.comments_done
+                        ELSE 0
+                    END,
+                    comments_offset = CASE
+                        WHEN posts.comments_count = excluded.comments_count THEN posts.comments_offset
+                        ELSE 0
+                    END
+                """,
+                rows,
+            )
+            self.conn.execute(
+                "UPDATE groups SET next_offset = ?, anchor_post_id = ? WHERE group_name = ?",
+                (next_offset, anchor_post_id, group_name),
+            )
+
+    def _drop_stale_rows(self, group_name):
+        """Deletes what the previous full run stored for a group, once the new run has data"""
+        row = self.conn.execute(
+            "SELECT stale FROM groups WHERE group_name = ?", (group_name,)
+        ).fetchone()
+        if not (row and row[0]):
+            return
+        self.conn.execute("DELETE FROM comments WHERE group_name = ?", (group_name,))
+        self.conn.execute("DELETE FROM posts WHERE group_name = ?", (group_name,))
+        self.conn.execute("UPDATE groups SET stale = 0 WHERE group_name = ?", (group_name,))
+
+    def mark_posts_done(self, group_name):
+        with self.conn:
+            self._drop_stale_rows(group_name)
+            self.conn.execute(
+                "UPDATE groups SET posts_done = 1 WHERE group_name = ?", (group_name,)
+            )
+
+    def posts_pending_comments(self, group_name, post_ids=None):
+        """Ids of posts that have comments which were not fetched yet.
+
+        With `post_ids` only those posts are checked.
+        """
+        query = """
+            SELECT post_id FROM posts
+            WHERE group_name = ? AND comments_count > 0 AND comments_done = 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM groups g WHERE g.group_name = posts.group_name AND g.stale = 1
+              )
+        """
+        params = [group_name]
+        if post_ids is not None:
+            query += f" AND post_id IN ({','.join('?' * len(post_ids))})"
+            params += list(post_ids)
+        rows = self.conn.execute(query + " ORDER BY date_unix DESC, post_id DESC", params)
+        return [post_id for (post_id,) in rows]
+
+    def save_comments(self, group_name, post_id, comments):
+        with self.conn:
+            # A refetch replaces the previous top comments of the post
+            self.conn.execute(
+                "DELETE FROM comments WHERE group_name = ? AND post_id = ?",
+                (group_name, post_id),
+            )
+            self._insert_comments(group_name, post_id, comments)
+            self.conn.execute(
+                "UPDATE posts SET comments_done = 1 WHERE group_name = ? AND post_id = ?",
+                (group_name, post_id),
+            )
+
+    def comments_offset(self, group_name, post_id):
+        """Offset of the first top-level comment page not saved yet (full-thread mode)"""
+        row = self.conn.execute(
+            "SELECT comments_offset FROM posts WHERE group_name = ? AND post_id = ?",
+            (group_name, post_id),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def save_comments_page(self, group_name, post_id, comments, parent_id=None):
+        """Stores one page of comments, or of replies to `parent_id`, keeping the ones saved before"""
+        with self.conn:
+            self._insert_comments(group_name, post_id, comments, parent_id)
+
+    def finish_comments_page(self, group_name, post_id, next_offset, done=False):
+        """Moves the top-level comment offset of a post once a page and all its threads are saved"""
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE posts SET comments_offset = ?, comments_done = ?
+                WHERE group_name = ? AND post_id = ?
+                """,
+                (next_offset, int(done), group_name, post_id),
+            )
+
+    def _insert_comments(self, group_name, post_id, comments, parent_id=None):
+        rows = [
+            (
+                group_name,
+                post_id,
+                c["id"],
+                c.get("text", ""),
+                c.get("likes", {}).get("count", 0),
+                c.get("date", 0),
+                parent_id,
+            )
+            for c in comments
+        ]
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO comments (group_name, post_id, comment_id, text, likes, date_unix, parent_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+
+    def mark_group_completed(self, group_name):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE groups SET completed = 1 WHERE group_name = ?", (group_name,)
+            )
+
+    def mark_group_failed(self, group_name):
+        """Leaves a group out of the current run, so the run can finish without it"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE groups SET failed = 1 WHERE group_name = ?", (group_name,)
+            )
+
+    def record_failed_attempt(self, group_name):
+        """Counts an unfinished crawl of a group, after GROUP_MAX_ATTEMPTS the group is marked failed.
+
+        Returns True if the group was given up on.
+        """
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE groups SET
+                    attempts = attempts + 1,
+                    failed = CASE WHEN attempts + 1 >= ? THEN 1 ELSE failed END
+                WHERE group_name = ?
+                """,
+                (GROUP_MAX_ATTEMPTS, group_name),
+            )
+        row = self.conn.execute(
+            "SELECT failed FROM groups WHERE group_name = ?", (group_name,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def counts(self):
+        """Returns (posts, comments) stored so far"""
+        posts = self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+        comments = self.conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+        return posts, comments
+
+    def incomplete_groups(self):
+        """Groups that may still be completed in the current run"""
+        rows = self.conn.execute("SELECT group_name FROM groups WHERE completed = 0 AND failed = 0")
+        return [group_name for (group_name,) in rows]
+
+    def failed_groups(self):
+        """Groups left out of the current run, they are crawled again by the next one"""
+        rows = self.conn.execute("SELECT group_name FROM groups WHERE completed = 0 AND failed = 1")
+        return [group_name for (group_name,) in rows]
+
+    def iter_posts_with_comments(self, group_name):
+        """Yields (post, comments) pairs of a group in wall order, comments sorted by likes"""
+        rows = self.conn.execute(
+            """
+            SELECT p.post_id, p.text, p.likes, p.comments_count, p.date_unix,
+                   c.comment_id, c.text, c.likes, c.date_unix, c.parent_id
+            FROM posts p
+            LEFT JOIN comments c ON c.group_name = p.group_name AND c.post_id = p.post_id
+            WHERE p.group_name = ?
+            ORDER BY p.date_unix DESC, p.post_id DESC, c.likes DESC, c.comment_id
+            """,
+            (group_name,),
+        )
+
+        post, comments = None, []
+        for post_id, text, likes, comments_count, date_unix, c_id, c_text, c_likes, c_date, c_parent in rows:
+            if post is None or post["id"] != post_id:
+                if post is not None:
+                    yield post, comments
+                post = {
+                    "id": post_id,
+                    "text": text,
+                    "likes": likes,
+                    "comments_count": comments_count,
+                    "date": date_unix,
+                }
+                comments = []
+            if c_id is not None:
+                comments.append({
+                    "id": c_id,
+                    "text": c_text,
+                    "likes": c_likes,
+                    "date": c_date,
+                    "parent_id": c_parent,
+                })
+
+        if post is not None:
+            yield post, comments
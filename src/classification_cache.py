@@ -0,0 +1,109 @@
+"""
+Постоянный кэш меток tuvan_detector.py.
+
+Ключ - sha1 текста в нижнем регистре, поэтому одинаковые тексты (репосты,
+приветствия, объявления) классифицируются один раз, а при повторном запуске
+классифицируются только новые тексты. Метки хранятся в SQLite вместе с
+версией правил: если правила изменились, кэш очищается при открытии.
+Поверх SQLite в памяти процесса держится LRU последних меток.
+"""
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict
+
+# Меток в LRU одного процесса
+MEMORY_ENTRIES = 500_000
+
+# Ключей в одном запросе к SQLite (ограничение на число параметров)
+SQL_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS labels (
+    text_hash BLOB PRIMARY KEY,
+    label TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+def text_key(text_lower):
+    """Ключ кэша для текста, уже приведённого к нижнему регистру"""
+    return hashlib.sha1(text_lower.encode('utf-8', 'surrogatepass')).digest()
+
+class ClassificationCache:
+    """Метки текстов по ключу text_key для версии правил rules_version"""
+
+    def __init__(self, path, rules_version, memory_entries=MEMORY_ENTRIES):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Процессы пула analyze_dataset пишут в один файл
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._check_rules_version(rules_version)
+
+    def _check_rules_version(self, rules_version):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'rules_version'").fetchone()
+        if row and row[0] == rules_version:
+            return
+        # Метки, посчитанные по другим правилам, больше не верны
+        with self.conn:
+            self.conn.execute("DELETE FROM labels")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('rules_version', ?)",
+                (rules_version,),
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys):
+        """Известные метки ключей: {ключ: метка}"""
+        found = {}
+        missing = []
+        for key in keys:
+            label = self.memory.get(key)
+            if label is None:
+                missing.append(key)
+            else:
+                self.memory.move_to_end(key)
+                found[key] = label
+
+        for start in range(0, len(missing), SQL_BATCH):
+            batch = missing[start:start + SQL_BATCH]
+            rows = self.conn.execute(
+                f"SELECT text_hash, label FROM labels WHERE text_hash IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for key, label in rows:
+                found[key] = label
+                self._remember(key, label)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, labels):
+        """Сохраняет пары (ключ, метка)"""
+        labels = list(labels)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO labels (text_hash, label) VALUES (?, ?)", labels
+            )
+        for key, label in labels:
+            self._remember(key, label)
+
+    def _remember(self, key, label):
+        self.memory[key] = label
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
@@ -39,4 +39,31 @@ COMMUNITY_MEDIA_GROUPS = [
 
 POSTS_PER_GROUP = 5000  # Maximum according to VK API
 MAX_COMMENTS = 10
-MAX_REQUESTS_PER_SECOND = 2  # Safe limit for VK API
\ No newline at end of file
+MAX_REQUESTS_PER_SECOND = 2  # Safe limit for VK API
+RATE_LIMIT_BURST = 2  # Requests that may go out back-to-back before pacing kicks in
+MAX_CONCURRENT_GROUPS = 4  # Groups crawled at the same time (across all categories)
+EXECUTE_MAX_CALLS = 25  # VK limit of API calls inside one `execute` request
+INCREMENTAL_REFRESH_DAYS = 7  # Incremental runs re-check comment counts of posts this recent
+WRITE_BATCH_SIZE = 5000  # Records held in memory before they are flushed to the output file
+TOKEN_QUARANTINE_SECONDS = {6: 10, 29: 3600}  # How long a token sits out after a throttling error
+MIN_REQUESTS_PER_SECOND = 0.2  # Adaptive rate never drops below this
+RATE_INCREASE_STEP = 0.05  # Rate added back after every successful request
+RATE_DECREASE_FACTOR = 0.5  # Rate multiplier after a throttling error
+MAX_RETRIES = 5  # Retries of a failed request before it is given up
+RETRY_BASE_DELAY = 1  # Seconds, doubled with every retry (with jitter)
+RETRY_MAX_DELAY = 60
+GROUPS_PER_REQUEST = 500  # Screen names resolved by one groups.getById call
+COMMENT_WORKERS = 25  # Comment requests in flight per group, enough to fill an `execute` batch
+COMMENT_QUEUE_SIZE = 200  # Posts waiting for their comments before post paging pauses
+COMMENTS_PAGE_SIZE = 100  # wall.getComments maximum, used by --full-threads
+THREAD_ITEMS_COUNT = 10  # Replies returned inline with each comment; longer threads are paged separately
+SAMPLE_PAGE_SIZE = 10  # Consecutive posts per sampled page in --sample-per-year mode; smaller spreads the sample wider
+METRICS_INTERVAL = 15  # Seconds between metrics snapshots (metrics.jsonl and collector.prom next to the checkpoint)
+HTTP_CONNECTION_LIMIT = 32  # Open keep-alive connections to the API
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 60  # Idle connections are kept this long for the next request
+LEASE_SECONDS = 120  # A scheduler worker must renew its group leases within this time or lose them
+LEASE_POLL_SECONDS = 5  # How often an idle worker checks for groups released by others
+LEASE_MAX_ATTEMPTS = 3  # Leases of one group per run before it is left for the next run
+CHECKPOINT_BUSY_TIMEOUT = 30  # Seconds a process waits for another one's checkpoint write
+GROUP_MAX_ATTEMPTS = 3  # Unfinished crawls of one group before it is left out of the run
@@ -0,0 +1,283 @@
+"""Crawls the groups of the registry with several worker processes.
+
+    python crawl_scheduler.py --workers 4
+
+The coordinator starts (or resumes) a run in the checkpoint store and queues
+every active group of group_registry.py there. Every worker process gets an
+access token of its own (VK_ACCESS_TOKENS) and leases groups from the queue.
+A lease lasts LEASE_SECONDS and is renewed while the worker is busy, so the
+groups of a worker that died are taken over by the others once their leases
+run out, resuming from the checkpoint. When the queue is empty the
+coordinator writes the per-category outputs from the shared store, exactly
+like get_posts.py does.
+
+More machines can join a running crawl with `--join`, with tokens of their
+own. All of them must open the same dataset/raw/crawl_state.sqlite, which
+needs a filesystem with working SQLite locking (a local disk shared by
+containers, not a typical network share).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import get_posts
+from checkpoint import CrawlCheckpoint
+from group_registry import GroupRegistry
+from metrics import CrawlMetrics
+from raw_dataset import OUTPUT_FORMATS, OUTPUT_LAYOUTS
+from constants import (
+    MAX_CONCURRENT_GROUPS,
+    LEASE_SECONDS,
+    LEASE_POLL_SECONDS,
+    LEASE_MAX_ATTEMPTS,
+    CHECKPOINT_BUSY_TIMEOUT,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS group_leases (
+    group_name TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class LeaseQueue:
+    """Groups of the current run, leased to one worker at a time.
+
+    Kept in the checkpoint store, so every process that can open the store
+    shares the queue.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=CHECKPOINT_BUSY_TIMEOUT, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def fill(self, categories, new_run):
+        """Queues the groups of `categories`; a new run starts from an empty queue"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        if new_run:
+            self.conn.execute("DELETE FROM group_leases")
+        # Groups that ran out of attempts get another chance in every invocation
+        self.conn.execute("UPDATE group_leases SET attempts = 0 WHERE done = 0")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO group_leases (group_name, category) VALUES (?, ?)",
+            [
+                (group_name, cat_name)
+                for cat_name, cat_data in categories.items()
+                for group_name in cat_data["groups"]
+            ],
+        )
+        self.conn.execute("COMMIT")
+
+    def lease(self, worker):
+        """Leases the next free group to `worker`, returns (group, category) or None"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        row = self.conn.execute(
+            """
+            SELECT group_name, category FROM group_leases
+            WHERE done = 0 AND lease_expires < ? AND attempts < ?
+            ORDER BY attempts, rowid LIMIT 1
+            """,
+            (now, LEASE_MAX_ATTEMPTS),
+        ).fetchone()
+        if row:
+            self.conn.execute(
+                """
+                UPDATE group_leases SET worker = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE group_name = ?
+                """,
+                (worker, now + LEASE_SECONDS, row[0]),
+            )
+        self.conn.execute("COMMIT")
+        return row
+
+    def renew(self, worker, group_names):
+        if not group_names:
+            return
+        self.conn.executemany(
+            "UPDATE group_leases SET lease_expires = ? WHERE group_name = ? AND worker = ?",
+            [(time.time() + LEASE_SECONDS, name, worker) for name in group_names],
+        )
+
+    def complete(self, group_name):
+        self.conn.execute(
+            "UPDATE group_leases SET done = 1, worker = NULL WHERE group_name = ?", (group_name,)
+        )
+
+    def release(self, group_name):
+        """Gives a group back without completing it, e.g. after failed requests"""
+        self.conn.execute(
+            "UPDATE group_leases SET lease_expires = 0, worker = NULL WHERE group_name = ?",
+            (group_name,),
+        )
+
+    def remaining(self):
+        """Groups that are not done and may still be leased or are being crawled"""
+        return self.conn.execute(
+            """
+            SELECT COUNT(*) FROM group_leases
+            WHERE done = 0 AND (attempts < ? OR lease_expires >= ?)
+            """,
+            (LEASE_MAX_ATTEMPTS, time.time()),
+        ).fetchone()[0]
+
+
+async def crawl_leased_groups(index, token, checkpoint_path, options):
+    get_posts.token_pool = get_posts.TokenPool([token])
+    get_posts.metrics = CrawlMetrics({"worker": str(index)})
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    checkpoint = CrawlCheckpoint(checkpoint_path)
+    queue = LeaseQueue(checkpoint_path)
+    held = set()
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            queue.renew(worker, held)
+
+    async def crawl_slot(session):
+        while True:
+            lease = queue.lease(worker)
+            if lease is None:
+                if not queue.remaining():
+                    return
+                await asyncio.sleep(LEASE_POLL_SECONDS)
+                continue
+
+            group_name, category = lease
+            print(f"\n[worker {index}] Leased {group_name} ({category})")
+            held.add(group_name)
+            try:
+                owner_ids = await get_posts.resolve_owner_ids(session, checkpoint, [group_name])
+                await get_posts.process_group(
+                    session, checkpoint, category, group_name, owner_ids.get(group_name),
+                    options["full_threads"], options["sample_per_year"],
+                )
+            except Exception as e:
+                print(f"❌ [worker {index}] Critical error processing {group_name}: {e}")
+                checkpoint.record_failed_attempt(group_name)
+            finally:
+                held.discard(group_name)
+
+            progress = checkpoint.group_progress(category, group_name)
+            if progress["completed"] or progress["failed"]:
+                queue.complete(group_name)
+            else:
+                queue.release(group_name)
+
+    directory = os.path.dirname(checkpoint_path) or "."
+    metrics_paths = (
+        os.path.join(directory, f"metrics.worker{index}.jsonl"),
+        os.path.join(directory, f"collector.worker{index}.prom"),
+    )
+    beat = asyncio.create_task(heartbeat())
+    try:
+        async with get_posts.create_session() as session:
+            await asyncio.gather(*(crawl_slot(session) for _ in range(MAX_CONCURRENT_GROUPS)))
+    finally:
+        beat.cancel()
+        get_posts.metrics.export(*metrics_paths)
+        print(f"\n📈 [worker {index}] {get_posts.metrics.summary()}")
+        queue.close()
+        checkpoint.close()
+
+
+def run_worker(index, token, checkpoint_path, options):
+    try:
+        asyncio.run(crawl_leased_groups(index, token, checkpoint_path, options))
+    except KeyboardInterrupt:
+        pass
+
+
+def run(args):
+    registry = GroupRegistry()
+    categories = registry.categories(get_posts.OUTPUT_DIR)
+    registry.close()
+    checkpoint_path = get_posts.CHECKPOINT_FILE
+    if args.sample_per_year:
+        os.makedirs(get_posts.SAMPLE_OUTPUT_DIR, exist_ok=True)
+        categories = get_posts.sample_categories(categories)
+        checkpoint_path = get_posts.SAMPLE_CHECKPOINT_FILE
+
+    tokens = get_posts.ACCESS_TOKENS
+    if not tokens:
+        raise SystemExit("❌ No access tokens, set VK_ACCESS_TOKENS")
+    workers = min(args.workers, len(tokens))
+    if workers < args.workers:
+        print(f"⚠️ Only {len(tokens)} tokens, starting {workers} workers (one token each)")
+
+    checkpoint = CrawlCheckpoint(checkpoint_path)
+    queue = LeaseQueue(checkpoint_path)
+    if args.join:
+        print(f"🤝 Joining the crawl in {checkpoint_path}: {queue.remaining()} groups left")
+    else:
+        resumed, incremental = checkpoint.start_run(args.incremental)
+        queue.fill(categories, new_run=not resumed)
+        if resumed:
+            print(f"♻️ Resuming the interrupted run from {checkpoint_path}")
+        print(f"🚀 {queue.remaining()} groups queued for {workers} workers")
+    queue.close()
+
+    options = {"full_threads": args.full_threads, "sample_per_year": args.sample_per_year}
+    processes = [
+        multiprocessing.Process(
+            target=run_worker, args=(i, tokens[i], checkpoint_path, options), name=f"crawl-worker-{i}"
+        )
+        for i in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n\n⚠️ Scheduler interrupted by user, stopping workers...")
+        for process in processes:
+            process.join()
+
+    try:
+        # Only the coordinator writes the outputs, joined machines just crawl
+        if args.join:
+            return
+        get_posts.export_all_categories(checkpoint, args.format, args.layout, categories)
+        incomplete = checkpoint.incomplete_groups()
+        if incomplete:
+            print(f"\n⚠️ {len(incomplete)} groups are incomplete: {', '.join(incomplete)}")
+            print("🔁 Run the scheduler again to resume them")
+            return
+        get_posts.report_failed_groups(checkpoint)
+        checkpoint.finish_run()
+        print("\n🎉 ALL data collection completed!")
+    finally:
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawls the registry's VK groups with worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, one token each")
+    parser.add_argument("--join", action="store_true",
+                        help="only add workers to a crawl coordinated by another scheduler")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only collect posts published since the previous run")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="parquet")
+    parser.add_argument("--layout", choices=OUTPUT_LAYOUTS, default="normalized")
+    parser.add_argument("--full-threads", action="store_true",
+                        help="collect every comment and reply instead of the top comments")
+    parser.add_argument("--sample-per-year", type=int, metavar="N",
+                        help="only collect up to N posts per year from every group")
+    args = parser.parse_args()
+    if args.sample_per_year and args.incremental:
+        parser.error("--sample-per-year cannot be combined with --incremental")
+    run(args)
@@ -0,0 +1,423 @@
+"""Offline stand-in for the parts of the VK API used by get_posts.py.
+
+Serves groups.getById, wall.get, wall.getComments and execute on
+http://HOST:PORT/method/<name> in one of three modes:
+
+- synthetic (default): deterministic generated groups with Tuvan and
+  Russian posts and comments, with configurable latency, random throttling
+  errors and a per-token rate limit;
+- record: proxies every request to the real API and saves the answer of
+  every single call (also the calls inside `execute`) to a directory;
+- replay: answers from such a directory, call by call, so a recorded crawl
+  can be repeated without network even if the calls are batched differently.
+
+Run it and point the collector at it:
+
+    python fake_vk_api.py --port 8080
+    VK_API_URL=http://127.0.0.1:8080/method VK_ACCESS_TOKENS=a,b python get_posts.py
+"""
+import aiohttp
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict, deque
+from aiohttp import web
+
+VK_API_URL = "https://api.vk.com/method"
+
+TUVAN_WORDS = ["шын", "күн", "өг", "үш", "аңнар", "бөгүн", "чөөн", "сүт", "өөренир", "күжүр"]
+TUVAN_KEYBOARD_WORDS = ["мен", "бистин", "ооренир", "чурек", "ачазы", "кожууннун", "менээ", "чок", "бар"]
+RUSSIAN_WORDS = [
+    "новости", "сегодня", "республика", "правительство", "в", "на", "и", "жители",
+    "города", "состоялось", "мероприятие", "поздравляем", "школа", "район",
+]
+
+START_DATE = 1420070400  # 2015-01-01
+
+CALL_RE = re.compile(r"API\.([\w.]+)\((\{.*?\})\)(?=,API\.|\];$)", re.S)
+
+
+class FakeVKError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def stable_int(*parts):
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return int(digest[:12], 16)
+
+
+def call_key(method, params):
+    """Identifies a call by method and parameters, ignoring the token"""
+    params = {k: str(v) for k, v in params.items() if k not in ("access_token", "v")}
+    raw = method + "?" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SyntheticWalls:
+    """Deterministic fake communities, generated on the fly from the group name"""
+
+    def __init__(self, posts_per_group=1000, max_comments_per_post=30,
+                 new_posts_per_minute=0, deleted_posts_per_minute=0):
+        self.posts_per_group = posts_per_group
+        self.max_comments_per_post = max_comments_per_post
+        # A busy wall: posts are published and deleted while a crawl pages it
+        self.new_posts_per_minute = new_posts_per_minute
+        self.deleted_posts_per_minute = deleted_posts_per_minute
+        self.started = time.time()
+
+    def group_id(self, screen_name):
+        return stable_int("group", screen_name) % 200_000_000 + 1
+
+    def text(self, *seed):
+        rng = random.Random(stable_int("text", *seed))
+        kind = rng.random()
+        if kind < 0.2:
+            words = TUVAN_WORDS + RUSSIAN_WORDS[:4]
+        elif kind < 0.35:
+            words = TUVAN_KEYBOARD_WORDS + RUSSIAN_WORDS[:4]
+        else:
+            words = RUSSIAN_WORDS
+        return " ".join(rng.choice(words) for _ in range(rng.randint(3, 60))).capitalize()
+
+    def wall_ids(self, group_id):
+        """Ids of the posts currently on the wall, newest first"""
+        elapsed = time.time() - self.started
+        count = self.posts_per_group + int(elapsed * self.new_posts_per_minute / 60)
+        ids = range(count, 0, -1)
+        if self.deleted_posts_per_minute:
+            lifetime = self.posts_per_group * 60 / self.deleted_posts_per_minute
+            ids = [i for i in ids if stable_int("deleted", group_id, i) % 10**6 * lifetime / 10**6 > elapsed]
+        return list(ids)
+
+    def post(self, group_id, post_id):
+        # ids and dates fall towards older posts, posts published later are dated now
+        now = int(time.time())
+        span = max(1, now - START_DATE)
+        date = min(now, START_DATE + span * post_id // (self.posts_per_group + 1))
+        rng = random.Random(stable_int("post", group_id, post_id))
+        return {
+            "id": post_id,
+            "owner_id": -group_id,
+            "from_id": -group_id,
+            "date": date,
+            "text": self.text(group_id, post_id),
+            "likes": {"count": rng.randint(0, 300)},
+            "comments": {"count": self.comment_count(group_id, post_id)},
+        }
+
+    def comment_count(self, group_id, post_id):
+        rng = random.Random(stable_int("comments", group_id, post_id))
+        if self.max_comments_per_post < 1 or rng.random() < 0.4:
+            return 0
+        return rng.randint(1, self.max_comments_per_post)
+
+    def reply_count(self, group_id, comment_id):
+        rng = random.Random(stable_int("replies", group_id, comment_id))
+        if self.max_comments_per_post < 1 or rng.random() < 0.8:
+            return 0
+        return rng.randint(1, self.max_comments_per_post)
+
+    def comment(self, group_id, post_id, index, need_likes, parent_id=None, thread_items=0):
+        if parent_id is None:
+            comment_id = post_id * 1000 + index + 1
+        else:
+            comment_id = parent_id * 1000 + index + 1
+        rng = random.Random(stable_int("comment", group_id, comment_id))
+        comment = {
+            "id": comment_id,
+            "from_id": rng.randint(1, 10_000_000),
+            "post_id": post_id,
+            "owner_id": -group_id,
+            "date": self.post(group_id, post_id)["date"] + rng.randint(60, 86400),
+            "text": self.text(group_id, "c", comment_id),
+        }
+        if need_likes:
+            comment["likes"] = {"count": rng.randint(0, 50)}
+        if parent_id is None:
+            replies = self.reply_count(group_id, comment_id)
+            comment["thread"] = {
+                "count": replies,
+                "items": [
+                    self.comment(group_id, post_id, i, need_likes, comment_id)
+                    for i in range(min(replies, thread_items))
+                ],
+            }
+        else:
+            comment["parents_stack"] = [parent_id]
+        return comment
+
+    def resolve_owner(self, params):
+        if "owner_id" in params:
+            return abs(int(params["owner_id"]))
+        if "domain" in params:
+            return self.group_id(params["domain"])
+        raise FakeVKError(100, "One of the parameters specified was missing or invalid: owner_id")
+
+    def groups_get_by_id(self, params):
+        names = str(params.get("group_ids") or params.get("group_id") or "").split(",")
+        groups = []
+        for name in filter(None, (n.strip() for n in names)):
+            groups.append({"id": self.group_id(name), "screen_name": name, "name": name.title()})
+        if not groups:
+            raise FakeVKError(100, "One of the parameters specified was missing or invalid: group_ids")
+        return {"groups": groups}
+
+    def wall_get(self, params):
+        group_id = self.resolve_owner(params)
+        offset = int(params.get("offset", 0))
+        count = min(int(params.get("count", 20)), 100)
+        ids = self.wall_ids(group_id)
+        items = [self.post(group_id, post_id) for post_id in ids[offset:offset + count]]
+        return {"count": len(ids), "items": items}
+
+    def wall_get_comments(self, params):
+        group_id = self.resolve_owner(params)
+        post_id = int(params["post_id"])
+        parent_id = int(params["comment_id"]) if params.get("comment_id") else None
+        if parent_id is None:
+            total = self.comment_count(group_id, post_id)
+        else:
+            total = self.reply_count(group_id, parent_id)
+        offset = int(params.get("offset", 0))
+        count = min(int(params.get("count", 10)), 100)
+        need_likes = str(params.get("need_likes", "0")) == "1"
+        thread_items = min(int(params.get("thread_items_count", 0)), 10)
+        indexes = range(total)
+        if params.get("sort") == "desc":
+            indexes = reversed(indexes)
+        indexes = list(indexes)[offset:offset + count]
+        items = [
+            self.comment(group_id, post_id, i, need_likes, parent_id, thread_items)
+            for i in indexes
+        ]
+        return {"count": total, "current_level_count": total, "items": items}
+
+
+class FakeVKServer:
+    def __init__(self, mode="synthetic", walls=None, data_dir=None, upstream=VK_API_URL,
+                 latency=0.05, jitter=0.02, error_rate=0.0, rate_limit=3.0):
+        self.mode = mode
+        self.walls = walls or SyntheticWalls()
+        self.data_dir = data_dir
+        self.upstream = upstream
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.recent = defaultdict(deque)
+        self.stats = Counter()
+        self.session = None
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+
+        self.handlers = {
+            "groups.getById": self.walls.groups_get_by_id,
+            "wall.get": self.walls.wall_get,
+            "wall.getComments": self.walls.wall_get_comments,
+        }
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/method/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        app.on_cleanup.append(self.close)
+        return app
+
+    async def close(self, app=None):
+        if self.session is not None:
+            await self.session.close()
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.stats))
+
+    def throttled(self, token):
+        """Sliding one-second window per token, like VK's per-token limit"""
+        now = time.monotonic()
+        window = self.recent[token]
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if self.rate_limit and len(window) >= self.rate_limit:
+            return True
+        window.append(now)
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+
+        self.stats["requests"] += 1
+        self.stats[f"requests.{method}"] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.mode == "synthetic" and self.throttled(params.get("access_token")):
+            self.stats["throttled"] += 1
+            body = {"error": {"error_code": 6, "error_msg": "Too many requests per second"}}
+        elif self.mode == "record":
+            body = await self.record(method, params)
+        else:
+            body = self.answer(method, params)
+
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.stats["bytes_sent"] += len(payload)
+        response = web.Response(body=payload, content_type="application/json")
+        # gzip/deflate when the client asks for it, like the real API
+        response.enable_compression()
+        return response
+
+    def answer(self, method, params):
+        if method == "execute":
+            return self.execute(params.get("code", ""))
+        try:
+            return {"response": self.call(method, params)}
+        except FakeVKError as e:
+            return {"error": {"error_code": e.code, "error_msg": e.message}}
+
+    def call(self, method, params):
+        if self.mode == "replay":
+            return self.load(method, params)
+        if method not in self.handlers:
+            raise FakeVKError(3, f"Unknown method passed: {method}")
+        self.stats["calls"] += 1
+        return self.handlers[method](params)
+
+    def execute(self, code):
+        calls = parse_execute_code(code)
+        if calls is None or len(calls) > 25:
+            return {"error": {"error_code": 12, "error_msg": "Unable to compile code"}}
+
+        results, errors = [], []
+        for method, params in calls:
+            try:
+                results.append(self.call(method, params))
+            except FakeVKError as e:
+                results.append(False)
+                errors.append({"method": method, "error_code": e.code, "error_msg": e.message})
+        body = {"response": results}
+        if errors:
+            body["execute_errors"] = errors
+        return body
+
+    # Record / replay
+
+    def path(self, method, params):
+        return os.path.join(self.data_dir, f"{method}-{call_key(method, params)}.json")
+
+    def save(self, method, params, body):
+        with open(self.path(method, params), "w", encoding="utf-8") as f:
+            json.dump(body, f, ensure_ascii=False)
+
+    def load(self, method, params):
+        try:
+            with open(self.path(method, params), encoding="utf-8") as f:
+                body = json.load(f)
+        except FileNotFoundError:
+            raise FakeVKError(10, f"No recorded answer for {method}")
+        self.stats["calls"] += 1
+        if "error" in body:
+            raise FakeVKError(body["error"]["error_code"], body["error"]["error_msg"])
+        return body["response"]
+
+    async def record(self, method, params):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        async with self.session.post(f"{self.upstream}/{method}", data=params) as resp:
+            body = await resp.json()
+
+        if "error" in body:
+            # Throttling and auth errors say nothing about the call itself
+            return body
+
+        if method != "execute":
+            self.save(method, params, body)
+            return body
+
+        calls = parse_execute_code(params.get("code", "")) or []
+        errors = iter(body.get("execute_errors", []))
+        for (call_method, call_params), result in zip(calls, body.get("response") or []):
+            if result is False:
+                error = next(errors, {})
+                self.save(call_method, call_params, {"error": {
+                    "error_code": error.get("error_code"),
+                    "error_msg": error.get("error_msg"),
+                }})
+            else:
+                self.save(call_method, call_params, {"response": result})
+        return body
+
+
+def parse_execute_code(code):
+    """Parses the `return [API.method({...}), ...];` programs built by ExecuteBatcher"""
+    code = code.strip()
+    if not (code.startswith("return [") and code.endswith("];")):
+        return None
+    try:
+        return [(method, json.loads(params)) for method, params in CALL_RE.findall(code)]
+    except json.JSONDecodeError:
+        return None
+
+
+async def start_server(server, host="127.0.0.1", port=0):
+    """Starts the server in the running loop, returns (runner, base url of the API)"""
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}/method"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the VK API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument("--data-dir", default="dataset/vk_recordings",
+                        help="where record mode saves and replay mode reads answers")
+    parser.add_argument("--upstream", default=VK_API_URL, help="real API for record mode")
+    parser.add_argument("--posts-per-group", type=int, default=1000)
+    parser.add_argument("--max-comments", type=int, default=30, help="maximum comments per post")
+    parser.add_argument("--new-posts-per-minute", type=float, default=0,
+                        help="posts published on every wall while it is crawled")
+    parser.add_argument("--deleted-posts-per-minute", type=float, default=0,
+                        help="posts deleted from every wall while it is crawled")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="± seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with error 6")
+    parser.add_argument("--rate-limit", type=float, default=3.0,
+                        help="requests per second per token before error 6 (0 = unlimited)")
+    return parser
+
+
+def server_from_args(args):
+    return FakeVKServer(
+        mode=args.mode,
+        walls=SyntheticWalls(
+            args.posts_per_group, args.max_comments,
+            args.new_posts_per_minute, args.deleted_posts_per_minute,
+        ),
+        data_dir=args.data_dir if args.mode != "synthetic" else None,
+        upstream=args.upstream,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    print(f"🧪 Fake VK API ({args.mode}) on http://{args.host}:{args.port}/method")
+    web.run_app(server_from_args(args).app(), host=args.host, port=args.port, print=None)
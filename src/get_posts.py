@@ -1,10 +1,20 @@
 import aiohttp
+import argparse
 import asyncio
-import pandas as pd
+import json
 import os
+import random
 import time
 from datetime import datetime
 from dotenv import load_dotenv
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from checkpoint import CrawlCheckpoint
+from group_registry import GroupRegistry
+from metrics import CrawlMetrics
+from raw_dataset import OUTPUT_FORMATS, OUTPUT_LAYOUTS, DatasetSink, output_path
 from constants import (
     OFFICIAL_MEDIA_GROUPS,
     GOV_INSTITUTIONS_GROUPS,
@@ -12,17 +22,62 @@ from constants import (
     POSTS_PER_GROUP,
     MAX_COMMENTS,
     MAX_REQUESTS_PER_SECOND,
+    RATE_LIMIT_BURST,
+    MAX_CONCURRENT_GROUPS,
+    EXECUTE_MAX_CALLS,
+    INCREMENTAL_REFRESH_DAYS,
+    WRITE_BATCH_SIZE,
+    TOKEN_QUARANTINE_SECONDS,
+    MIN_REQUESTS_PER_SECOND,
+    RATE_INCREASE_STEP,
+    RATE_DECREASE_FACTOR,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    GROUPS_PER_REQUEST,
+    COMMENT_WORKERS,
+    COMMENT_QUEUE_SIZE,
+    COMMENTS_PAGE_SIZE,
+    THREAD_ITEMS_COUNT,
+    SAMPLE_PAGE_SIZE,
+    METRICS_INTERVAL,
+    HTTP_CONNECTION_LIMIT,
+    DNS_CACHE_SECONDS,
+    KEEPALIVE_SECONDS,
+    GROUP_MAX_ATTEMPTS,
 )
 load_dotenv()
 
-ACCESS_TOKEN = os.getenv("VK_ACCESS_TOKEN")
+# Several tokens can be given as a comma-separated VK_ACCESS_TOKENS,
+# a single VK_ACCESS_TOKEN still works
+ACCESS_TOKENS = [
+    token.strip()
+    for token in (os.getenv("VK_ACCESS_TOKENS") or os.getenv("VK_ACCESS_TOKEN") or "").split(",")
+    if token.strip()
+]
 API_VERSION = "5.199"
+# VK_API_URL can point the collector at fake_vk_api.py
+API_URL = os.getenv("VK_API_URL", "https://api.vk.com/method")
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+SESSION_TIMEOUT = aiohttp.ClientTimeout(total=1800)
+
+# Unknown error, authorization failed (another token may work), too many
+# requests, flood control, internal server error, rate limit reached
+RETRYABLE_ERROR_CODES = {1, 5, 6, 9, 10, 29}
+# Too many requests, flood control, rate limit reached: the rate is cut on each
+THROTTLING_ERROR_CODES = {6, 9, 29}
 OUTPUT_DIR = "dataset/raw"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 OFFICIAL_MEDIA_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "official_media_posts.csv")
 GOV_INSTITUTIONS_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "gov_institutions_posts.csv")
 COMMUNITY_MEDIA_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "community_media_posts.csv")
+CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, "crawl_state.sqlite")
+
+# Year-stratified samples are kept apart from the full crawl
+SAMPLE_OUTPUT_DIR = "dataset/sample"
+SAMPLE_CHECKPOINT_FILE = os.path.join(SAMPLE_OUTPUT_DIR, "crawl_state.sqlite")
 
 ALL_CATEGORIES = {
     "OfficialMedia": OFFICIAL_MEDIA_GROUPS,
@@ -46,6 +101,17 @@ CATEGORIES = {
 }
 
 
+def sample_categories(categories=None):
+    """The categories with their output files moved to SAMPLE_OUTPUT_DIR"""
+    return {
+        cat_name: {
+            "groups": cat_data["groups"],
+            "output": os.path.join(SAMPLE_OUTPUT_DIR, os.path.basename(cat_data["output"])),
+        }
+        for cat_name, cat_data in (categories or CATEGORIES).items()
+    }
+
+
 def unix_timestamp_to_datetime(timestamp):
     """Convert Unix timestamp to datetime string"""
     if timestamp is None or timestamp == 0:
@@ -65,59 +131,334 @@ def get_year_from_timestamp(timestamp):
         return None
 
 
+def year_start_timestamp(year):
+    """Unix timestamp of January 1 of `year`, in the same local time as get_year_from_timestamp"""
+    return int(datetime(year, 1, 1).timestamp())
+
+
 class RateLimiter:
-    def __init__(self, rate_limit=MAX_REQUESTS_PER_SECOND):
+    """Token bucket shared by every request made with one token.
+
+    Up to `burst` requests may go out back-to-back, after that requests are
+    spaced so the sustained rate stays at `rate_limit` per second. The rate
+    adapts AIMD-style: it creeps up after every success and is cut on every
+    throttling error, staying between MIN_REQUESTS_PER_SECOND and the
+    configured maximum.
+    """
+
+    def __init__(self, rate_limit=MAX_REQUESTS_PER_SECOND, burst=RATE_LIMIT_BURST):
+        self.max_rate = rate_limit
         self.rate_limit = rate_limit
-        self.interval = 1.0 / rate_limit
-        self.last_request_time = 0
-        self.lock = asyncio.Lock()
-    
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate_limit)
+        self.last_refill = now
+
+    def increase(self):
+        self._refill()
+        self.rate_limit = min(self.max_rate, self.rate_limit + RATE_INCREASE_STEP)
+
+    def decrease(self):
+        self._refill()
+        self.rate_limit = max(MIN_REQUESTS_PER_SECOND, self.rate_limit * RATE_DECREASE_FACTOR)
+
+    def delay(self):
+        """Seconds until the next request could go out"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate_limit
+
     async def wait(self):
-        async with self.lock:
-            current_time = time.time()
-            elapsed = current_time - self.last_request_time
-            
-            if elapsed < self.interval:
-                wait_time = self.interval - elapsed
-                await asyncio.sleep(wait_time)
-            
-            self.last_request_time = time.time()
+        # Every caller takes its token immediately (the balance may go negative)
+        # and sleeps until its slot, so waiters are served in arrival order
+        # without holding a lock while sleeping
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate_limit
+            metrics.observe_blocked("rate_limiter", delay)
+            await asyncio.sleep(delay)
 
 
-rate_limiter = RateLimiter()
+def mask_token(token):
+    return token[:6] + "…"
 
 
-async def fetch(session, url, params):
-    await rate_limiter.wait()
-    
-    timeout = aiohttp.ClientTimeout(total=30)
-    try:
-        async with session.get(url, params=params, timeout=timeout) as resp:
-            data = await resp.json()
-            if "error" in data:
-                err = data["error"]
-                error_code = err.get('error_code')
-                error_msg = err.get('error_msg')
-                print(f"⚠️ VK API Error {error_code}: {error_msg}")
-                
-                # If rate limit error - wait longer
-                if error_code in [6, 29]:  # Too many requests
-                    print("🔄 Too many requests, waiting 10 seconds...")
-                    await asyncio.sleep(10)
-                    return None
+class TokenPool:
+    """Access tokens, each with its own RateLimiter.
+
+    Every request goes to the token that has a free slot first, so throughput
+    grows with the number of tokens. A token rejected with error 5 is dropped
+    for the rest of the run, one that hits error 6 or 29 sits out for a while.
+    """
+
+    def __init__(self, tokens, rate_limit=MAX_REQUESTS_PER_SECOND, burst=RATE_LIMIT_BURST):
+        self.limiters = {token: RateLimiter(rate_limit, burst) for token in tokens}
+        self.quarantined_until = {}
+        self.revoked = set()
+
+    def _available(self):
+        now = time.monotonic()
+        return [
+            token for token in self.limiters
+            if token not in self.revoked and self.quarantined_until.get(token, 0) <= now
+        ]
+
+    async def acquire(self):
+        """Waits for a rate limiter slot on the least busy usable token and returns it"""
+        while True:
+            tokens = self._available()
+            if tokens:
+                token = min(tokens, key=lambda t: self.limiters[t].delay())
+                await self.limiters[token].wait()
+                return token
+
+            waiting = [t for t in self.limiters if t not in self.revoked]
+            if not waiting:
+                raise RuntimeError("No usable VK access token (set VK_ACCESS_TOKENS)")
+            wake_up = min(self.quarantined_until[t] for t in waiting)
+            delay = max(0, wake_up - time.monotonic())
+            metrics.observe_blocked("quarantine", delay)
+            await asyncio.sleep(delay)
+
+    def report_success(self, token):
+        self.limiters[token].increase()
+
+    def report_error(self, token, error_code):
+        if error_code == 5:  # Authorization failed
+            print(f"🚫 Token {mask_token(token)} was rejected, it will not be used again")
+            self.revoked.add(token)
+        elif error_code in TOKEN_QUARANTINE_SECONDS:
+            limiter = self.limiters[token]
+            limiter.decrease()
+            seconds = TOKEN_QUARANTINE_SECONDS[error_code]
+            print(f"🔄 Token {mask_token(token)} is throttled, pausing it for {seconds} seconds "
+                  f"and slowing down to {limiter.rate_limit:.2f} req/s...")
+            self.quarantined_until[token] = time.monotonic() + seconds
+        elif error_code in THROTTLING_ERROR_CODES:
+            limiter = self.limiters[token]
+            limiter.decrease()
+            print(f"🔄 Token {mask_token(token)} hit flood control, slowing down to {limiter.rate_limit:.2f} req/s...")
+
+
+token_pool = TokenPool(ACCESS_TOKENS)
+metrics = CrawlMetrics()
+
+
+class VKApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"VK API Error {code}: {message}")
+        self.code = code
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def create_session():
+    """HTTP session of a crawl: pooled keep-alive connections, cached DNS, compressed responses"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        ttl_dns_cache=DNS_CACHE_SECONDS,
+        keepalive_timeout=KEEPALIVE_SECONDS,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=SESSION_TIMEOUT,
+        headers={"Accept-Encoding": "gzip, deflate"},
+    )
+
+
+def decode_json(body):
+    """Decodes a response body; orjson (if installed) parses the bytes without building a str"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def endpoint_name(url):
+    return url.rsplit("/", 1)[-1]
+
+
+async def fetch(session, url, params, token=None):
+    """Sends an API request, retrying throttled and failed attempts with backoff.
+
+    `token` may be a token already acquired for the first attempt. Returns the
+    decoded response body, or None when the API refused the request for good
+    or all MAX_RETRIES retries failed.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if token is None:
+            try:
+                token = await token_pool.acquire()
+            except RuntimeError as e:
+                # Every token was revoked, no retry can succeed
+                print(f"❌ Giving up on {url}: {e}")
                 return None
-            return data.get("response", {})
-    except asyncio.TimeoutError:
-        print(f"⏰ Timeout while requesting {url}")
-        return None
-    except Exception as e:
-        print(f"❌ Request error: {e}")
-        return None
+        try:
+            return await request(session, url, params, token)
+        except VKApiError as e:
+            print(f"⚠️ {e}")
+            if e.code not in RETRYABLE_ERROR_CODES:
+                return None
+        except asyncio.TimeoutError:
+            print(f"⏰ Timeout while requesting {url}")
+            metrics.observe_error(endpoint_name(url), "timeout")
+        except Exception as e:
+            print(f"❌ Request error: {e}")
+            metrics.observe_error(endpoint_name(url), "network")
+        token = None
+        
+        if attempt < MAX_RETRIES:
+            delay = backoff_delay(attempt)
+            print(f"🔁 Retrying in {delay:.1f} seconds (attempt {attempt + 2}/{MAX_RETRIES + 1})...")
+            metrics.observe_blocked("retry_backoff", delay)
+            await asyncio.sleep(delay)
+    
+    print(f"❌ Giving up on {url} after {MAX_RETRIES + 1} attempts")
+    return None
+
 
+async def request(session, url, params, token):
+    """Sends one API request with `token` without waiting for a rate limiter slot.
 
-async def get_owner_id(session, group_name):
-    print(f"  Getting owner_id for '{group_name}'...")
+    Returns the decoded response body and raises VKApiError for API errors.
+    """
+    params = {**params, "access_token": token, "v": API_VERSION}
+    started = time.perf_counter()
+    # A form body instead of a query string: execute code with hundreds of
+    # group names would not fit in the request line
+    async with session.post(url, data=params, timeout=REQUEST_TIMEOUT) as resp:
+        body = await resp.read()
+    metrics.observe_request(endpoint_name(url), time.perf_counter() - started, len(body))
+    data = decode_json(body)
     
+    if "error" in data:
+        err = data["error"]
+        error_code = err.get('error_code')
+        metrics.observe_error(endpoint_name(url), error_code)
+        token_pool.report_error(token, error_code)
+        raise VKApiError(error_code, err.get('error_msg'))
+    
+    token_pool.report_success(token)
+    return data
+
+
+class ExecuteBatcher:
+    """Packs API calls into VK `execute` requests of up to EXECUTE_MAX_CALLS calls.
+
+    Callers await `call()` as if it were a single request. While one batch is
+    waiting for a token with a free slot, new calls keep joining it, so the busier
+    the crawl, the fuller every request gets.
+    """
+
+    def __init__(self, max_calls=EXECUTE_MAX_CALLS):
+        self.max_calls = max_calls
+        self.pending = []
+        self.sender_waiting = False
+        self.tasks = set()
+
+    async def call(self, session, method, params):
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        self._enqueue(session, (method, params, future, 0))
+        result = await future
+        metrics.observe_call(method, time.perf_counter() - started)
+        return result
+
+    def _enqueue(self, session, item):
+        self.pending.append(item)
+        if not self.sender_waiting:
+            self._start_sender(session)
+
+    def _start_sender(self, session):
+        self.sender_waiting = True
+        task = asyncio.create_task(self._send_batch(session))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send_batch(self, session):
+        try:
+            token = await token_pool.acquire()
+        except Exception as e:
+            token = None
+            print(f"❌ Execute batch error: {e}")
+        self.sender_waiting = False
+
+        batch = self.pending[:self.max_calls]
+        del self.pending[:self.max_calls]
+        if self.pending:
+            self._start_sender(session)
+
+        code = "return [" + ",".join(
+            f"API.{method}({json.dumps(params, ensure_ascii=False)})"
+            for method, params, _, _ in batch
+        ) + "];"
+
+        data = None
+        if token is not None:
+            try:
+                data = await fetch(session, f"{API_URL}/execute", {"code": code}, token)
+            except Exception as e:
+                # The futures of the batch must still be resolved below
+                print(f"❌ Execute batch error: {e}")
+        if data is None:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_result(None)
+            return
+
+        # A failed call inside execute comes back as `false`, its error is the
+        # next entry of `execute_errors`
+        results = data.get("response")
+        if not isinstance(results, list):
+            results = []
+        errors = iter(data.get("execute_errors", []))
+        
+        loop = asyncio.get_running_loop()
+        token_errors = set()
+        for i, item in enumerate(batch):
+            method, params, future, attempt = item
+            result = results[i] if i < len(results) else False
+            if result is False:
+                error = next(errors, {})
+                error_code = error.get("error_code")
+                metrics.observe_error(method, error_code)
+                if error_code == 5 or error_code in THROTTLING_ERROR_CODES:
+                    token_errors.add(error_code)
+                if error_code is not None and error_code not in RETRYABLE_ERROR_CODES:
+                    # The API answered for good (closed comments, deleted post...)
+                    print(f"⚠️ VK API Error {error_code} in {method}: {error.get('error_msg')}")
+                    result = {}
+                elif attempt < MAX_RETRIES:
+                    retry_item = (method, params, future, attempt + 1)
+                    delay = backoff_delay(attempt)
+                    metrics.observe_blocked("retry_backoff", delay)
+                    loop.call_later(delay, self._enqueue, session, retry_item)
+                    continue
+                else:
+                    print(f"❌ Giving up on {method} after {MAX_RETRIES + 1} attempts")
+                    result = None
+            if not future.done():
+                future.set_result(result)
+        
+        # Per-method limits inside execute count against the batch's token and
+        # cut its rate, once per batch however many calls hit them
+        for error_code in token_errors:
+            token_pool.report_error(token, error_code)
+
+
+execute_batcher = ExecuteBatcher()
+
+
+def normalize_group_name(group_name):
+    """Turns a link or club/public/id-prefixed name into what groups.getById accepts"""
     group_name = group_name.strip()
 
     if "vk.com/" in group_name:
@@ -126,65 +467,93 @@ async def get_owner_id(session, group_name):
     if group_name.startswith(("club", "public", "id")):
         group_name = group_name.lstrip("club").lstrip("public").lstrip("id")
 
-    params = {
-        "group_id": group_name,
-        "access_token": ACCESS_TOKEN,
-        "v": API_VERSION,
-    }
+    return group_name
 
-    url = "https://api.vk.com/method/groups.getById"
 
-    data = await fetch(session, url, params)
-    if data is None:
-        return None
+# owner_id of a group the API does not know (renamed or deleted)
+OWNER_NOT_FOUND = 0
+
+
+async def resolve_owner_ids(session, checkpoint, group_names):
+    """Returns {group name: owner_id} for all groups.
+
+    Ids are read from the on-disk cache in the checkpoint store; all the
+    groups missing there are resolved with one groups.getById call per
+    GROUPS_PER_REQUEST names and added to the cache. Groups the API answered
+    for but did not find get OWNER_NOT_FOUND, groups whose request failed are
+    left out.
+    """
+    owner_ids = checkpoint.cached_owner_ids(group_names)
+    missing = [name for name in group_names if name not in owner_ids]
+    print(f"🔎 owner_id of {len(owner_ids)} groups cached, resolving {len(missing)}...")
+
+    for start in range(0, len(missing), GROUPS_PER_REQUEST):
+        chunk = missing[start:start + GROUPS_PER_REQUEST]
+        normalized = [normalize_group_name(name) for name in chunk]
+        params = {
+            "group_ids": ",".join(normalized),
+        }
+
+        data = await execute_batcher.call(session, "groups.getById", params)
+        if data is None:
+            print(f"⚠ Request for owner_id of {len(chunk)} groups failed, they will be resumed on the next run")
+            continue
+        
+        # Process new response format, for backward compatibility: old format
+        if isinstance(data, dict):
+            groups_list = data.get("groups", [])
+        elif isinstance(data, list):
+            groups_list = data
+        else:
+            print(f"⚠ Invalid VK response for owner_id of {len(chunk)} groups")
+            continue
 
-    # Process new response format
-    if isinstance(data, dict) and "groups" in data:
-        groups_list = data.get("groups", [])
-        if groups_list:
-            group_info = groups_list[0]
+        by_name = {}
+        for group_info in groups_list:
             group_id = group_info.get("id")
-            if group_id:
-                owner_id = -abs(group_id)
-                print(f"  ✅ owner_id for '{group_name}': {owner_id}")
-                return owner_id
-    
-    # For backward compatibility: old format
-    elif isinstance(data, list) and data:
-        group_info = data[0]
-        group_id = group_info.get("id")
-        if group_id:
-            owner_id = -abs(group_id)
-            print(f"  ✅ owner_id for '{group_name}': {owner_id}")
-            return owner_id
-
-    print(f"⚠ Invalid VK response for owner_id of '{group_name}'")
-    return None
+            if not group_id:
+                continue
+            by_name[str(group_id)] = -abs(group_id)
+            if group_info.get("screen_name"):
+                by_name[group_info["screen_name"].lower()] = -abs(group_id)
+
+        resolved = {}
+        for i, (name, lookup) in enumerate(zip(chunk, normalized)):
+            owner_id = by_name.get(lookup.lower())
+            if owner_id is None and len(groups_list) == len(chunk) and groups_list[i].get("id"):
+                # Screen name changed since it was configured: answers keep the request order
+                owner_id = -abs(groups_list[i]["id"])
+            if owner_id is None:
+                print(f"⚠ Invalid VK response for owner_id of '{name}'")
+                owner_ids[name] = OWNER_NOT_FOUND
+                continue
+            resolved[name] = owner_id
+
+        checkpoint.cache_owner_ids(resolved)
+        owner_ids.update(resolved)
+
+    return owner_ids
 
 
 async def get_posts(session, domain, count=100, offset=0):
+    """Returns one page of posts, or None if the request failed"""
     print(f"    Requesting posts from {domain} (offset={offset}, count={count})...")
     
-    url = "https://api.vk.com/method/wall.get"
     params = {
-        "access_token": ACCESS_TOKEN,
-        "v": API_VERSION,
         "domain": domain,
         "count": min(count, 100),  # VK maximum 100 per request
         "offset": offset
     }
     
-    data = await fetch(session, url, params)
-    if data and "items" in data:
-        return data.get("items", [])
-    return []
+    data = await execute_batcher.call(session, "wall.get", params)
+    if data is None:
+        return None
+    return data.get("items", [])
 
 
 async def get_comments(session, owner_id, post_id, max_comments=5):
-    url = "https://api.vk.com/method/wall.getComments"
+    """Returns the top comments of a post, or None if the request failed"""
     params = {
-        "access_token": ACCESS_TOKEN,
-        "v": API_VERSION,
         "owner_id": owner_id,
         "post_id": post_id,
         "count": min(100, max_comments * 2),
@@ -192,87 +561,405 @@ async def get_comments(session, owner_id, post_id, max_comments=5):
         "extended": 0
     }
     
-    data = await fetch(session, url, params)
-    if not data:
-        return []
+    data = await execute_batcher.call(session, "wall.getComments", params)
+    if data is None:
+        return None
     
     items = data.get("items", [])
     items = sorted(items, key=lambda x: x.get("likes", {}).get("count", 0), reverse=True)
     return items[:max_comments]
 
 
-async def get_all_posts_from_group(session, domain, max_posts=5000):
-    """Gets ALL posts from a group (up to specified maximum)"""
-    print(f"  📊 Loading ALL posts from group {domain}...")
+async def get_comments_page(session, owner_id, post_id, offset=0, comment_id=None):
+    """Returns one page of comments, oldest first, or None if the request failed.
+
+    With `comment_id` the page holds the replies to that comment.
+    """
+    params = {
+        "owner_id": owner_id,
+        "post_id": post_id,
+        "count": COMMENTS_PAGE_SIZE,
+        "offset": offset,
+        "sort": "asc",
+        "need_likes": 1,
+        "extended": 0
+    }
+    if comment_id is None:
+        params["thread_items_count"] = THREAD_ITEMS_COUNT
+    else:
+        params["comment_id"] = comment_id
+    
+    data = await execute_batcher.call(session, "wall.getComments", params)
+    if data is None:
+        return None
+    return data.get("items", [])
+
+
+async def save_thread(session, checkpoint, group, owner_id, post_id, comment):
+    """Saves all replies to a top-level comment page by page, False if a request failed"""
+    thread = comment.get("thread", {})
+    replies = thread.get("items", [])
+    if replies:
+        checkpoint.save_comments_page(group, post_id, replies, comment["id"])
+    
+    # The inline replies are the first ones of the thread
+    offset = len(replies)
+    while offset < thread.get("count", 0):
+        page = await get_comments_page(session, owner_id, post_id, offset, comment["id"])
+        if page is None:
+            return False
+        if not page:
+            break
+        checkpoint.save_comments_page(group, post_id, page, comment["id"])
+        offset += len(page)
+    return True
+
+
+async def save_all_comments(session, checkpoint, group, owner_id, post_id):
+    """Saves every comment of a post together with the reply threads (--full-threads).
+
+    Top-level comments are paged oldest first, so comments added during the
+    crawl only append pages. Every page is saved as soon as it arrives and the
+    threads under it are paged concurrently (their requests share `execute`
+    batches with everything else) before the next page is requested, so only
+    one page per post is held in memory. An interrupted post continues after
+    the last page whose threads were saved completely.
+    Returns True once the whole post is saved.
+    """
+    offset = checkpoint.comments_offset(group, post_id)
+    
+    while True:
+        page = await get_comments_page(session, owner_id, post_id, offset)
+        if page is None:
+            return False
+        
+        checkpoint.save_comments_page(group, post_id, page)
+        saved = await asyncio.gather(*(
+            save_thread(session, checkpoint, group, owner_id, post_id, comment)
+            for comment in page
+            if comment.get("thread", {}).get("count")
+        ))
+        if not all(saved):
+            return False
+        
+        offset += len(page)
+        done = len(page) < COMMENTS_PAGE_SIZE
+        checkpoint.finish_comments_page(group, post_id, offset, done)
+        if done:
+            return True
+
+
+async def get_all_posts_from_group(session, checkpoint, category, domain, max_posts=5000, offset=0,
+                                   anchor_post_id=None, known_post_id=None, on_page=None):
+    """Gets ALL posts from a group (up to specified maximum), saving every page.
+
+    `wall.get` only pages by offset, and offsets shift while posts are
+    published or deleted, so paging is anchored on post ids instead: every
+    page starts with the last post of the previous one, only posts older
+    than the oldest saved one (the anchor) are kept, and a page that starts
+    below the previous one (posts above it were deleted) is requested again
+    from an earlier offset. Each post is saved once per run, at the cost of
+    one overlapping post per page.
+
+    Starts from `offset` and `anchor_post_id` so an interrupted group
+    continues where it stopped. `on_page` is awaited with the new posts of
+    every saved page, before the next one is requested.
+    With `known_post_id` (incremental mode) paging stops once it reaches
+    stored posts older than INCREMENTAL_REFRESH_DAYS; the recent stored posts
+    on the way are saved again so changed comment counts get refetched.
+    Returns True once the whole wall (or `max_posts`) has been loaded.
+    """
+    print(f"  📊 Loading ALL posts from group {domain} (from offset {offset})...")
     
-    all_posts = []
-    offset = 0
     batch_size = 100
+    refresh_since = time.time() - INCREMENTAL_REFRESH_DAYS * 24 * 3600
+    loaded = 0
+    # Everything above the anchor was saved, so it is also a valid first post to expect
+    last_post_id = anchor_post_id
     
-    while len(all_posts) < max_posts:
+    while offset < max_posts:
         posts_batch = await get_posts(session, domain, batch_size, offset)
         
+        if posts_batch is None:
+            print(f"    ⚠️ Request failed at offset {offset}, the group will be resumed on the next run")
+            return False
+        
         if not posts_batch:
             print(f"    No more posts to load")
             break
         
-        if offset == 0 and posts_batch:
-            print(f"    First batch loaded: {len(posts_batch)} posts")
+        regular = [post for post in posts_batch if not post.get("is_pinned")]
+        if last_post_id is not None and offset > 0 and regular and regular[0]["id"] < last_post_id:
+            # The wall moved up under us, the posts right after the previous page would be skipped
+            offset = max(0, offset - (batch_size - 1))
+            print(f"    Posts were deleted, stepping back to offset {offset}")
+            continue
+        
+        if anchor_post_id is None:
+            new_posts = posts_batch
+        else:
+            # The pinned post was saved with the first page
+            new_posts = [post for post in regular if post["id"] < anchor_post_id]
+        
+        new_ids = [post["id"] for post in new_posts if not post.get("is_pinned")]
+        if new_ids:
+            anchor_post_id = min(new_ids)
+        if regular:
+            last_post_id = regular[-1]["id"]
         
-        all_posts.extend(posts_batch)
+        # The next page overlaps this one by its last post
+        offset += max(1, len(posts_batch) - 1)
+        checkpoint.save_posts_page(category, domain, new_posts, offset, anchor_post_id)
         
-        print(f"    Loaded {len(all_posts)} posts...")
+        loaded += len(new_posts)
+        print(f"    Loaded {loaded} posts...")
+        
+        if on_page is not None and new_posts:
+            await on_page(new_posts)
+        
+        if known_post_id is not None and any(
+            not post.get("is_pinned")
+            and post["id"] <= known_post_id
+            and post.get("date", 0) < refresh_since
+            for post in posts_batch
+        ):
+            print(f"    Reached posts stored by a previous run")
+            break
         
         if len(posts_batch) < batch_size:
             print(f"    All posts loaded (received less than requested)")
             break
+    
+    checkpoint.mark_posts_done(domain)
+    print(f"  ✅ All posts loaded from {domain}")
+    return True
+
+
+async def sample_posts_from_group(session, checkpoint, category, domain, per_year, on_page=None):
+    """Loads up to `per_year` posts of every year of a group's wall (--sample-per-year).
+
+    The wall is ordered newest first, so the first offset of each year is
+    found by binary search over one-post `wall.get` pages; the searches of
+    all years run at once and share `execute` batches. Years with more posts
+    than `per_year` are sampled with SAMPLE_PAGE_SIZE-post pages at evenly
+    spaced offsets, so the sample covers the whole year and the number of
+    requests depends on the number of years, not on the number of posts.
+    `on_page` is awaited with the sampled posts of every year.
+    Returns True once every year has been sampled.
+    """
+    print(f"  📊 Sampling {per_year} posts per year from group {domain}...")
+    
+    data = await execute_batcher.call(session, "wall.get", {"domain": domain, "count": 1, "offset": 0})
+    if data is None:
+        print(f"    ⚠️ Request failed, the group will be resumed on the next run")
+        return False
+    
+    total = data.get("count", 0)
+    items = data.get("items", [])
+    # A pinned post can be of any date, the wall is ordered by date after it
+    first = 1 if items and items[0].get("is_pinned") else 0
+    if items and first:
+        checkpoint.save_posts_page(category, domain, items, 0)
+    
+    dates = {}
+    
+    async def date_at(offset):
+        if offset not in dates:
+            posts = await get_posts(session, domain, 1, offset)
+            if not posts:
+                return None
+            dates[offset] = posts[0].get("date", 0)
+        return dates[offset]
+    
+    async def first_offset_before(timestamp):
+        """First offset with a post older than `timestamp`, `total` if there is none"""
+        lo, hi = first, total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            date = await date_at(mid)
+            if date is None:
+                return None
+            if date < timestamp:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+    
+    years = []
+    if total > first:
+        newest, oldest = await asyncio.gather(date_at(first), date_at(total - 1))
+        if newest is None or oldest is None:
+            print(f"    ⚠️ Request failed, the group will be resumed on the next run")
+            return False
+        years = list(range(get_year_from_timestamp(newest), get_year_from_timestamp(oldest) - 1, -1))
+    
+    # Year y takes the offsets from bounds[i] (the first post before January 1 of y + 1)
+    # up to bounds[i + 1]
+    bounds = await asyncio.gather(*(
+        first_offset_before(year_start_timestamp(year)) for year in [y + 1 for y in years[:1]] + years
+    ))
+    if any(bound is None for bound in bounds):
+        print(f"    ⚠️ Request failed while searching year boundaries, the group will be resumed on the next run")
+        return False
+    
+    async def sample_year(year, start, end):
+        size = end - start
+        if size <= per_year:
+            pages = [(offset, min(100, end - offset)) for offset in range(start, end, 100)]
+        else:
+            n_pages = -(-per_year // SAMPLE_PAGE_SIZE)
+            pages = [(start + i * size // n_pages, SAMPLE_PAGE_SIZE) for i in range(n_pages)]
         
-        offset += batch_size
+        results = await asyncio.gather(*(
+            get_posts(session, domain, count, offset) for offset, count in pages
+        ))
+        if any(posts is None for posts in results):
+            return None
         
-        if offset % 300 == 0:  # Every 300 posts take a pause
-            print(f"    ⏸️ Pausing for 1 second...")
-            await asyncio.sleep(1)
+        sampled = {}
+        for posts in results:
+            for post in posts:
+                # Pages at the edges can reach into the neighbouring years
+                if not post.get("is_pinned") and get_year_from_timestamp(post.get("date")) == year:
+                    sampled[post["id"]] = post
+        sampled = sorted(sampled.values(), key=lambda post: post["id"], reverse=True)[:per_year]
         
-        await asyncio.sleep(0.3)
+        checkpoint.save_posts_page(category, domain, sampled, end)
+        print(f"    {year}: {len(sampled)} of {size} posts")
+        if on_page is not None and sampled:
+            await on_page(sampled)
+        return sampled
+    
+    sampled = await asyncio.gather(*(
+        sample_year(year, bounds[i], bounds[i + 1]) for i, year in enumerate(years)
+    ))
+    if any(posts is None for posts in sampled):
+        print(f"    ⚠️ Request failed while sampling, the group will be resumed on the next run")
+        return False
     
-    print(f"  ✅ Total {len(all_posts)} posts loaded from {domain}")
-    return all_posts
+    checkpoint.mark_posts_done(domain)
+    print(f"  ✅ Sampled {sum(len(posts) for posts in sampled)} of {total} posts from {domain} ({len(years)} years)")
+    return True
 
 
-async def process_group(session, category, group):
-    """Processes one group: ALL posts + comments"""
+async def process_group(session, checkpoint, category, group, owner_id, full_threads=False,
+                        sample_per_year=None):
+    """Processes one group: ALL posts + comments, skipping work saved by a previous run.
+
+    By default only the MAX_COMMENTS top comments of each post are kept, with
+    `full_threads` every comment and reply is collected. With `sample_per_year`
+    only a year-stratified sample of the posts is loaded instead of the wall.
+    """
     print(f"  Processing group: {group}")
     
-    owner_id = await get_owner_id(session, group)
-    if not owner_id:
-        print(f"  ❌ Failed to get owner_id for {group}")
-        return []
+    progress = checkpoint.group_progress(category, group)
+    if progress["completed"]:
+        print(f"  ⏭️ Group {group} already collected in this run")
+        return
+    if progress["failed"]:
+        print(f"  ⏭️ Group {group} was left out of this run")
+        return
+    
+    if owner_id == OWNER_NOT_FOUND:
+        # A renamed or deleted group, no retry can resolve it
+        print(f"  ❌ VK does not know {group}, it is left out of this run")
+        checkpoint.mark_group_failed(group)
+        return
+    if owner_id is None:
+        if checkpoint.record_failed_attempt(group):
+            print(f"  ❌ Failed to get owner_id for {group} after {GROUP_MAX_ATTEMPTS} attempts, "
+                  f"it is left out of this run")
+        else:
+            print(f"  ⚠️ Failed to get owner_id for {group}, it will be resumed on the next run")
+        return
 
-    all_posts = await get_all_posts_from_group(session, group, POSTS_PER_GROUP)
+    known_post_id = progress["known_post_id"]
+    if known_post_id is not None:
+        print(f"    Newest stored post: {known_post_id} ({unix_timestamp_to_datetime(progress['known_post_date'])})")
+
+    # Post pages feed a bounded queue that comment workers drain while paging
+    # goes on; posts without comments never enter the queue
+    queue = asyncio.Queue(maxsize=COMMENT_QUEUE_SIZE)
+    queued = set()
+    posts_done = progress["posts_done"]
+    failed = 0
     
-    if not all_posts:
-        print(f"  ℹ️ No posts found in group {group}")
-        return []
+    async def enqueue_pending(post_ids=None):
+        for post_id in checkpoint.posts_pending_comments(group, post_ids):
+            if post_id not in queued:
+                queued.add(post_id)
+                await queue.put(post_id)
     
-    print(f"  📊 Starting processing of {len(all_posts)} posts from {group}...")
+    async def produce():
+        nonlocal posts_done
+        # Posts stored by an interrupted run first, then every new page
+        await enqueue_pending()
+        if not posts_done and sample_per_year:
+            posts_done = await sample_posts_from_group(
+                session, checkpoint, category, group, sample_per_year,
+                on_page=lambda posts: enqueue_pending([post["id"] for post in posts]),
+            )
+        elif not posts_done:
+            posts_done = await get_all_posts_from_group(
+                session, checkpoint, category, group, POSTS_PER_GROUP, progress["next_offset"],
+                progress["anchor_post_id"], known_post_id,
+                on_page=lambda posts: enqueue_pending([post["id"] for post in posts]),
+            )
+        for _ in range(COMMENT_WORKERS):
+            await queue.put(None)
     
-    group_data = []
+    async def comment_worker():
+        nonlocal failed
+        while True:
+            post_id = await queue.get()
+            if post_id is None:
+                return
+            if full_threads:
+                if not await save_all_comments(session, checkpoint, group, owner_id, post_id):
+                    failed += 1
+                continue
+            comments = await get_comments(session, owner_id, post_id, MAX_COMMENTS)
+            if comments is None:
+                failed += 1
+                continue
+            checkpoint.save_comments(group, post_id, comments)
     
-    for i, post in enumerate(all_posts, 1):
-        if i % 20 == 0 or i == 1 or i == len(all_posts): 
-            print(f"    Processed {i}/{len(all_posts)} posts...")
-        
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(comment_worker()) for _ in range(COMMENT_WORKERS)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    print(f"    Fetched comments for {len(queued) - failed} posts")
+    
+    if not posts_done or failed:
+        if checkpoint.record_failed_attempt(group):
+            print(f"  ❌ Group {group} is still incomplete ({failed} comment requests failed) "
+                  f"after {GROUP_MAX_ATTEMPTS} attempts, it is left out of this run")
+        else:
+            print(f"  ⚠️ Group {group} is incomplete ({failed} comment requests failed), it will be resumed on the next run")
+        return
+    
+    checkpoint.mark_group_completed(group)
+    print(f"  ✅ Group {group} processed")
+
+
+def iter_group_records(checkpoint, category, group):
+    """Yields the stored posts and comments of a group as flat output records"""
+    for post, comments in checkpoint.iter_posts_with_comments(group):
         post_id = post["id"]
-        post_text = post.get("text", "")
-        post_likes = post.get("likes", {}).get("count", 0)
-        comments_count = post.get("comments", {}).get("count", 0)
-        post_date_unix = post.get("date", 0)
+        post_text = post["text"]
+        post_likes = post["likes"]
+        comments_count = post["comments_count"]
+        post_date_unix = post["date"]
         
         # Convert Unix timestamp to datetime
         post_date = unix_timestamp_to_datetime(post_date_unix)
         post_year = get_year_from_timestamp(post_date_unix)
         
-        group_data.append({
+        yield {
             "type": "post",
             "category": category,
             "group": group,
@@ -288,20 +975,16 @@ async def process_group(session, category, group):
             "comment_likes": None,
             "comment_date_unix": None,
             "comment_date": None,
-            "comment_year": None
-        })
-        
-        if comments_count == 0:
-            continue
-        
-        comments = await get_comments(session, owner_id, post_id, MAX_COMMENTS)
+            "comment_year": None,
+            "comment_parent_id": None
+        }
         
         for c in comments:
-            comment_date_unix = c.get("date", 0)
+            comment_date_unix = c["date"]
             comment_date = unix_timestamp_to_datetime(comment_date_unix)
             comment_year = get_year_from_timestamp(comment_date_unix)
             
-            group_data.append({
+            yield {
                 "type": "comment",
                 "category": category,
                 "group": group,
@@ -313,97 +996,233 @@ async def process_group(session, category, group):
                 "post_date": post_date,
                 "post_year": post_year,
                 "comment_id": c["id"],
-                "comment_text": c.get("text", ""),
-                "comment_likes": c.get("likes", {}).get("count", 0),
+                "comment_text": c["text"],
+                "comment_likes": c["likes"],
                 "comment_date_unix": comment_date_unix, 
                 "comment_date": comment_date,
-                "comment_year": comment_year
-            })
-        
-        if i % 10 == 0:
-            await asyncio.sleep(0.2)
-    
-    print(f"  ✅ Group {group} processed, collected {len(group_data)} records (posts + comments)")
-    return group_data
+                "comment_year": comment_year,
+                "comment_parent_id": c["parent_id"]
+            }
 
 
-async def main():
-    print("🚀 Starting data collection from VK groups...")
-    print(f"📊 Total categories: {len(CATEGORIES)}")
+def export_category(checkpoint, cat_name, cat_data, output_format="parquet", layout="normalized"):
+    """Streams everything stored for the category to its output file(s).
+
+    Records are written in batches of WRITE_BATCH_SIZE, so memory use does not
+    depend on the number of groups or posts.
+    """
+    output_file = output_path(cat_data["output"], output_format, layout)
+    sink = DatasetSink(output_file, output_format, layout, WRITE_BATCH_SIZE)
+    post_count = comment_count = 0
+    post_years = set()
+    comment_years = set()
+    
+    try:
+        for group_name in cat_data["groups"]:
+            for record in iter_group_records(checkpoint, cat_name, group_name):
+                if record["type"] == "post":
+                    post_count += 1
+                    post_years.add(record["post_year"])
+                else:
+                    comment_count += 1
+                    comment_years.add(record["comment_year"])
+                sink.write(record)
+    except BaseException:
+        # An interrupted export must not replace the previous output
+        sink.discard()
+        raise
+    sink.close()
+    
+    if not sink.records_written:
+        print(f"⚠️ No data collected for category {cat_name}, the previous output is kept")
+        return
     
-    timeout = aiohttp.ClientTimeout(total=1800)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        for cat_name, cat_data in CATEGORIES.items():
-            groups = cat_data["groups"]
-            output_file = cat_data["output"]
+    print(f"📁 Output directory: {os.path.abspath(OUTPUT_DIR)}")
+    print(f"\n✅ Saved {post_count + comment_count} records to file {output_file}")
+    
+    # Year statistics for posts
+    post_years.discard(None)
+    if post_years:
+        print(f"   📅 Post years range: {min(post_years)} - {max(post_years)}")
+    
+    # Year statistics for comments
+    comment_years.discard(None)
+    if comment_years:
+        print(f"   📅 Comment years range: {min(comment_years)} - {max(comment_years)}")
+    
+    print(f"   📊 Statistics: {post_count} posts, {comment_count} comments")
 
-            print(f"\n{'='*60}")
-            print(f"📋 Category: {cat_name} ({len(groups)} groups)")
-            print(f"💾 Output file: {output_file}")
-            print(f"{'='*60}")
 
-            all_records = []
-            
-            for i, group_name in enumerate(groups, 1):
-                print(f"\n[{i}/{len(groups)}] ", end="")
-                try:
-                    records = await process_group(session, cat_name, group_name)
-                    if records:
-                        all_records.extend(records)
-                    
-                    if i < len(groups):
-                        print(f"    ⏸️ Pausing for 3 seconds before next group...")
-                        await asyncio.sleep(3)
-                        
-                except Exception as e:
-                    print(f"❌ Critical error processing {group_name}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            
-            if all_records:
-                df = pd.DataFrame(all_records)
-                df.to_csv(output_file, index=False, encoding="utf-8-sig")
-                print(f"📁 Output directory: {os.path.abspath(OUTPUT_DIR)}")
-                print(f"\n✅ Saved {len(df)} records to file {output_file}")
-                
-                # Statistics
-                post_count = len(df[df['type'] == 'post'])
-                comment_count = len(df[df['type'] == 'comment'])
-                
-                # Year statistics for posts
-                if 'post_year' in df.columns:
-                    post_years = df[df['post_year'].notna()]['post_year']
-                    if not post_years.empty:
-                        print(f"   📅 Post years range: {int(post_years.min())} - {int(post_years.max())}")
-                
-                # Year statistics for comments
-                if 'comment_year' in df.columns:
-                    comment_years = df[df['comment_year'].notna()]['comment_year']
-                    if not comment_years.empty:
-                        print(f"   📅 Comment years range: {int(comment_years.min())} - {int(comment_years.max())}")
-                
-                print(f"   📊 Statistics: {post_count} posts, {comment_count} comments")
-            else:
-                print(f"⚠️ No data collected for category {cat_name}")
+def export_all_categories(checkpoint, output_format="parquet", layout="normalized", categories=None):
+    for cat_name, cat_data in (categories or CATEGORIES).items():
+        export_category(checkpoint, cat_name, cat_data, output_format, layout)
+
+
+async def crawl_category(session, checkpoint, semaphore, owner_ids, cat_name, cat_data,
+                         output_format="parquet", layout="normalized", full_threads=False,
+                         sample_per_year=None):
+    """Crawls all groups of a category concurrently, bounded by the shared semaphore"""
+    groups = cat_data["groups"]
+    output_file = output_path(cat_data["output"], output_format, layout)
+
+    print(f"\n{'='*60}")
+    print(f"📋 Category: {cat_name} ({len(groups)} groups)")
+    print(f"💾 Output file: {output_file}")
+    print(f"{'='*60}")
+
+    async def crawl_group(i, group_name):
+        async with semaphore:
+            print(f"\n[{cat_name} {i}/{len(groups)}]")
+            try:
+                await process_group(
+                    session, checkpoint, cat_name, group_name, owner_ids.get(group_name),
+                    full_threads, sample_per_year,
+                )
+            except Exception as e:
+                print(f"❌ Critical error processing {group_name}: {e}")
+                checkpoint.record_failed_attempt(group_name)
+                import traceback
+                traceback.print_exc()
+
+    await asyncio.gather(*(
+        crawl_group(i, group_name) for i, group_name in enumerate(groups, 1)
+    ))
+
+    export_category(checkpoint, cat_name, cat_data, output_format, layout)
+
+
+def metrics_files(checkpoint):
+    """The JSON lines log and the Prometheus textfile, kept next to the checkpoint store"""
+    directory = os.path.dirname(checkpoint.path) or "."
+    return os.path.join(directory, "metrics.jsonl"), os.path.join(directory, "collector.prom")
+
+
+async def export_metrics(log_path, prometheus_path):
+    """Writes a metrics snapshot every METRICS_INTERVAL seconds until cancelled"""
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        metrics.export(log_path, prometheus_path)
+
+
+def report_failed_groups(checkpoint):
+    failed = checkpoint.failed_groups()
+    if failed:
+        print(f"\n⚠️ {len(failed)} groups could not be collected and were left out: {', '.join(failed)}")
+        print("🔁 The next run will try them again")
+
+
+async def main(checkpoint, incremental=False, output_format="parquet", layout="normalized",
+               categories=None, full_threads=False, sample_per_year=None):
+    categories = categories or CATEGORIES
+    print("🚀 Starting data collection from VK groups...")
+    print(f"📊 Total categories: {len(categories)}")
+    print(f"⚙️ Up to {MAX_CONCURRENT_GROUPS} groups at once, "
+          f"{len(token_pool.limiters)} tokens × {MAX_REQUESTS_PER_SECOND} req/s")
+    
+    resumed, incremental = checkpoint.start_run(incremental)
+    if resumed:
+        print(f"♻️ Resuming the interrupted run from {checkpoint.path}")
+    if incremental:
+        print("📈 Incremental mode: only posts newer than the stored ones are collected")
+    if full_threads:
+        print("🧵 Full-thread mode: every comment and reply is collected")
+    if sample_per_year:
+        print(f"🎯 Sampling mode: up to {sample_per_year} posts per year from every group")
+    
+    # All categories share one pool of group slots; pacing is left entirely
+    # to the rate limiter
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GROUPS)
+    metrics_paths = metrics_files(checkpoint)
+    exporter = asyncio.create_task(export_metrics(*metrics_paths))
+    try:
+        async with create_session() as session:
+            group_names = [name for cat_data in categories.values() for name in cat_data["groups"]]
+            owner_ids = await resolve_owner_ids(session, checkpoint, group_names)
             
-            # Pause between categories
-            if cat_name != list(CATEGORIES.keys())[-1]:
-                print(f"\n⏸️ Pausing for 10 seconds before next category...")
-                await asyncio.sleep(10)
+            await asyncio.gather(*(
+                crawl_category(
+                    session, checkpoint, semaphore, owner_ids, cat_name, cat_data, output_format,
+                    layout, full_threads, sample_per_year,
+                )
+                for cat_name, cat_data in categories.items()
+            ))
+    finally:
+        exporter.cancel()
+        metrics.export(*metrics_paths)
+        print(f"\n📈 {metrics.summary()}")
+    
+    incomplete = checkpoint.incomplete_groups()
+    if incomplete:
+        print(f"\n⚠️ {len(incomplete)} groups are incomplete: {', '.join(incomplete)}")
+        print("🔁 Run the script again to resume them")
+        return
     
+    report_failed_groups(checkpoint)
+    checkpoint.finish_run()
     print("\n" + "="*60)
     print("🎉 ALL data collection completed!")
     print("="*60)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collects posts and comments from VK groups")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only collect posts published since the previous run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_FORMATS),
+        default="parquet",
+        help="format of the per-category output files",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=OUTPUT_LAYOUTS,
+        default="normalized",
+        help="normalized: separate posts and comments tables, flat: one row per post or comment",
+    )
+    parser.add_argument(
+        "--full-threads",
+        action="store_true",
+        help="collect every comment and reply instead of the top comments of each post",
+    )
+    parser.add_argument(
+        "--sample-per-year",
+        type=int,
+        metavar="N",
+        help=f"only collect up to N posts per year from every group, into {SAMPLE_OUTPUT_DIR}",
+    )
+    args = parser.parse_args()
+    if args.sample_per_year and args.incremental:
+        parser.error("--sample-per-year cannot be combined with --incremental")
+    if not ACCESS_TOKENS:
+        raise SystemExit("❌ No access tokens, set VK_ACCESS_TOKENS")
+
+    registry = GroupRegistry()
+    categories = registry.categories(OUTPUT_DIR)
+    registry.close()
+    checkpoint_file = CHECKPOINT_FILE
+    if args.sample_per_year:
+        os.makedirs(SAMPLE_OUTPUT_DIR, exist_ok=True)
+        categories = sample_categories(categories)
+        checkpoint_file = SAMPLE_CHECKPOINT_FILE
+
+    checkpoint = CrawlCheckpoint(checkpoint_file)
     try:
-        asyncio.run(main())
+        asyncio.run(main(
+            checkpoint, args.incremental, args.format, args.layout, categories,
+            full_threads=args.full_threads, sample_per_year=args.sample_per_year,
+        ))
     except KeyboardInterrupt:
         print("\n\n⚠️ Script interrupted by user")
-        print("💾 Attempting to save already collected data...")
+        print("💾 Saving already collected data...")
+        export_all_categories(checkpoint, args.format, args.layout, categories)
+        print(f"🔁 Progress is kept in {checkpoint_file}, run the script again to resume")
     except Exception as e:
         print(f"\n\n❌ Critical error: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+    finally:
+        checkpoint.close()
@@ -0,0 +1,161 @@
+"""Registry of the VK groups to crawl and their categories.
+
+The groups live in a SQLite file instead of constants.py, so communities can
+be added without editing source files:
+
+    python group_registry.py add CommunityMedia tuva_online podslushano17rus
+    python group_registry.py import CommunityMedia communities.txt
+    python group_registry.py remove podslushano17rus
+    python group_registry.py list
+
+A new registry is seeded with the group lists from constants.py.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from constants import (
+    OFFICIAL_MEDIA_GROUPS,
+    GOV_INSTITUTIONS_GROUPS,
+    COMMUNITY_MEDIA_GROUPS,
+)
+
+REGISTRY_FILE = os.path.join("dataset", "groups.sqlite")
+
+# Category -> (groups, output file) the registry starts with
+SEED_CATEGORIES = {
+    "OfficialMedia": (OFFICIAL_MEDIA_GROUPS, "official_media_posts.csv"),
+    "GovInstitutions": (GOV_INSTITUTIONS_GROUPS, "gov_institutions_posts.csv"),
+    "CommunityMedia": (COMMUNITY_MEDIA_GROUPS, "community_media_posts.csv"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    output_file TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS registry_groups (
+    group_name TEXT PRIMARY KEY,
+    category TEXT NOT NULL REFERENCES categories (name),
+    active INTEGER NOT NULL DEFAULT 1,
+    added_at INTEGER NOT NULL
+);
+"""
+
+
+def default_output_file(category):
+    """CommunityMedia -> community_media_posts.csv"""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", category).lower() + "_posts.csv"
+
+
+class GroupRegistry:
+    """SQLite registry of groups, each in exactly one category"""
+
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        if not self.conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0]:
+            self.seed()
+
+    def close(self):
+        self.conn.close()
+
+    def seed(self):
+        for category, (groups, output_file) in SEED_CATEGORIES.items():
+            self.add_category(category, output_file)
+            self.add_groups(category, groups)
+
+    def add_category(self, name, output_file=None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO categories (name, output_file) VALUES (?, ?)",
+                (name, output_file or default_output_file(name)),
+            )
+
+    def add_groups(self, category, group_names):
+        """Adds groups to a category (moving them if they were in another one), returns how many"""
+        self.add_category(category)
+        names = [name.strip() for name in group_names if name.strip()]
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO registry_groups (group_name, category, added_at) VALUES (?, ?, ?)
+                ON CONFLICT (group_name) DO UPDATE SET category = excluded.category, active = 1
+                """,
+                [(name, category, int(time.time())) for name in names],
+            )
+        return len(names)
+
+    def remove_groups(self, group_names):
+        """Stops crawling groups; they stay in the registry as inactive"""
+        with self.conn:
+            cursor = self.conn.executemany(
+                "UPDATE registry_groups SET active = 0 WHERE group_name = ?",
+                [(name.strip(),) for name in group_names],
+            )
+        return cursor.rowcount
+
+    def categories(self, output_dir):
+        """Active groups in the same shape as get_posts.CATEGORIES, outputs in `output_dir`"""
+        rows = self.conn.execute(
+            """
+            SELECT c.name, c.output_file, g.group_name
+            FROM categories c
+            JOIN registry_groups g ON g.category = c.name AND g.active = 1
+            ORDER BY c.rowid, g.added_at, g.rowid
+            """
+        )
+        categories = {}
+        for name, output_file, group_name in rows:
+            category = categories.setdefault(
+                name, {"groups": [], "output": os.path.join(output_dir, output_file)}
+            )
+            category["groups"].append(group_name)
+        return categories
+
+
+def read_group_file(path):
+    """One screen name or link per line; blank lines and # comments are skipped"""
+    with open(path, encoding="utf-8") as f:
+        return [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manages the registry of crawled VK groups")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help="registry file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add groups to a category")
+    add.add_argument("category")
+    add.add_argument("groups", nargs="+")
+
+    import_file = commands.add_parser("import", help="add the groups listed in a text file")
+    import_file.add_argument("category")
+    import_file.add_argument("file")
+
+    remove = commands.add_parser("remove", help="stop crawling groups")
+    remove.add_argument("groups", nargs="+")
+
+    commands.add_parser("list", help="show the active groups by category")
+    args = parser.parse_args()
+
+    registry = GroupRegistry(args.registry)
+    try:
+        if args.command == "add":
+            print(f"✅ {registry.add_groups(args.category, args.groups)} groups in {args.category}")
+        elif args.command == "import":
+            groups = read_group_file(args.file)
+            print(f"✅ {registry.add_groups(args.category, groups)} groups in {args.category}")
+        elif args.command == "remove":
+            print(f"✅ {registry.remove_groups(args.groups)} groups removed")
+        else:
+            for name, category in registry.categories("").items():
+                print(f"📋 {name} → {category['output']} ({len(category['groups'])} groups)")
+                for group_name in category["groups"]:
+                    print(f"   {group_name}")
+    finally:
+        registry.close()
@@ -0,0 +1,209 @@
+"""Counters and latency histograms of the collector's traffic to the VK API.
+
+get_posts.py records every HTTP request, every API call (also the ones
+packed into `execute`), API and network errors and the time spent blocked
+on rate limiters, throttled tokens and retry backoff. Snapshots are appended
+to a JSON lines log and written as a Prometheus textfile (for the node
+exporter textfile collector).
+"""
+import bisect
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+# Upper bounds in seconds; slow `execute` requests with 25 calls take seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PROMETHEUS_PREFIX = "vk_collector"
+
+
+class LatencyHistogram:
+    """Bucketed latencies with the same cumulative semantics as a Prometheus histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile, None without observations"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs ending with +Inf"""
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            yield bound, total
+
+
+class CrawlMetrics:
+    """Everything measured during one collector run.
+
+    `labels` are added to every Prometheus series, so several processes
+    (crawl_scheduler.py workers) can export side by side.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.started = time.monotonic()
+        # HTTP requests by endpoint (`execute`, `groups.getById`...)
+        self.requests = Counter()
+        self.request_latency = defaultdict(LatencyHistogram)
+        # API calls by method, from the caller's point of view: batching,
+        # rate limiter waits and retries included
+        self.calls = Counter()
+        self.call_latency = defaultdict(LatencyHistogram)
+        self.bytes_received = 0
+        # (endpoint or method, error code or "timeout"/"network")
+        self.errors = Counter()
+        # Seconds by reason (rate_limiter, quarantine, retry_backoff), summed
+        # over the waiting requests, so it can exceed the wall time
+        self.blocked_seconds = Counter()
+
+    def observe_request(self, endpoint, seconds, size):
+        self.requests[endpoint] += 1
+        self.request_latency[endpoint].observe(seconds)
+        self.bytes_received += size
+
+    def observe_call(self, method, seconds):
+        self.calls[method] += 1
+        self.call_latency[method].observe(seconds)
+
+    def observe_error(self, name, code):
+        self.errors[(name, str(code))] += 1
+
+    def observe_blocked(self, reason, seconds):
+        self.blocked_seconds[reason] += seconds
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def snapshot(self):
+        elapsed = self.elapsed()
+        total_requests = sum(self.requests.values())
+        return {
+            "time": round(time.time(), 3),
+            "labels": self.labels,
+            "elapsed_s": round(elapsed, 3),
+            "requests": dict(self.requests),
+            "requests_per_s": round(total_requests / elapsed, 3) if elapsed else 0,
+            "calls": dict(self.calls),
+            "bytes_received": self.bytes_received,
+            "request_latency_s": {name: h.to_dict() for name, h in self.request_latency.items()},
+            "call_latency_s": {name: h.to_dict() for name, h in self.call_latency.items()},
+            "errors": {f"{name}:{code}": count for (name, code), count in self.errors.items()},
+            "blocked_s": {reason: round(s, 3) for reason, s in self.blocked_seconds.items()},
+        }
+
+    def summary(self):
+        """One line for the end-of-run report"""
+        elapsed = self.elapsed()
+        total_requests = sum(self.requests.values())
+        blocked = ", ".join(f"{reason} {s:.1f} s" for reason, s in self.blocked_seconds.most_common())
+        return (
+            f"{total_requests} requests ({total_requests / elapsed if elapsed else 0:.2f} req/s), "
+            f"{sum(self.calls.values())} API calls, {self.bytes_received / 1e6:.1f} MB, "
+            f"{sum(self.errors.values())} errors, blocked: {blocked or 'never'}"
+        )
+
+    def write_json_log(self, path):
+        """Appends the current snapshot as one JSON line"""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+    def _labels(self, **labels):
+        pairs = {**self.labels, **labels}
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs.items()) + "}"
+
+    def prometheus_lines(self):
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {p}_uptime_seconds Seconds since the collector started",
+            f"# TYPE {p}_uptime_seconds gauge",
+            f"{p}_uptime_seconds{self._labels()} {self.elapsed():.3f}",
+            f"# HELP {p}_bytes_received_total Response bytes received from the API",
+            f"# TYPE {p}_bytes_received_total counter",
+            f"{p}_bytes_received_total{self._labels()} {self.bytes_received}",
+        ]
+        lines += self._counter_lines(
+            "requests_total", "HTTP requests sent to the API", "endpoint", self.requests
+        )
+        lines += self._histogram_lines(
+            "request_duration_seconds", "HTTP request latency", "endpoint", self.request_latency
+        )
+        lines += self._counter_lines(
+            "api_calls_total", "API calls, also the ones inside execute", "method", self.calls
+        )
+        lines += self._histogram_lines(
+            "api_call_duration_seconds", "API call latency including batching, waits and retries",
+            "method", self.call_latency,
+        )
+        lines += [
+            f"# HELP {p}_errors_total API and network errors",
+            f"# TYPE {p}_errors_total counter",
+        ]
+        for (name, code), count in sorted(self.errors.items()):
+            lines.append(f"{p}_errors_total{self._labels(method=name, code=code)} {count}")
+        lines += [
+            f"# HELP {p}_blocked_seconds_total Seconds requests waited before being sent",
+            f"# TYPE {p}_blocked_seconds_total counter",
+        ]
+        for reason, seconds in sorted(self.blocked_seconds.items()):
+            lines.append(f"{p}_blocked_seconds_total{self._labels(reason=reason)} {seconds:.3f}")
+        return lines
+
+    def _counter_lines(self, name, help_text, label, counter):
+        p = PROMETHEUS_PREFIX
+        lines = [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} counter"]
+        for key, count in sorted(counter.items()):
+            lines.append(f"{p}_{name}{self._labels(**{label: key})} {count}")
+        return lines
+
+    def _histogram_lines(self, name, help_text, label, histograms):
+        p = PROMETHEUS_PREFIX
+        lines = [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f"{p}_{name}_bucket{self._labels(**{label: key, 'le': bound})} {count}")
+            lines.append(f"{p}_{name}_sum{self._labels(**{label: key})} {histogram.sum:.6f}")
+            lines.append(f"{p}_{name}_count{self._labels(**{label: key})} {histogram.count}")
+        return lines
+
+    def write_prometheus(self, path):
+        """Replaces the textfile atomically, so a scrape never sees half of it"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.prometheus_lines()) + "\n")
+        os.replace(tmp_path, path)
+
+    def export(self, log_path, prometheus_path):
+        self.write_json_log(log_path)
+        self.write_prometheus(prometheus_path)
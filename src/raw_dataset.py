@@ -0,0 +1,373 @@
+import os
+import pandas as pd
+
+RECORD_COLUMNS = [
+    "type",
+    "category",
+    "group",
+    "post_id",
+    "post_text",
+    "post_likes",
+    "post_comments_count",
+    "post_date_unix",
+    "post_date",
+    "post_year",
+    "comment_id",
+    "comment_text",
+    "comment_likes",
+    "comment_date_unix",
+    "comment_date",
+    "comment_year",
+    "comment_parent_id",
+]
+
+# Normalized layout: one row per post, comments reference it by (group, post_id)
+POST_COLUMNS = [
+    "category",
+    "group",
+    "post_id",
+    "post_text",
+    "post_likes",
+    "post_comments_count",
+    "post_date_unix",
+    "post_date",
+    "post_year",
+]
+
+COMMENT_COLUMNS = [
+    "category",
+    "group",
+    "post_id",
+    "comment_id",
+    "comment_text",
+    "comment_likes",
+    "comment_date_unix",
+    "comment_date",
+    "comment_year",
+    "comment_parent_id",
+]
+
+# Column types shared by the collector (writing) and the detector (reading);
+# everything that is neither categorical nor integer is a string
+CATEGORICAL_COLUMNS = {"type", "category", "group"}
+
+INT_COLUMNS = {
+    "post_id",
+    "post_likes",
+    "post_comments_count",
+    "post_date_unix",
+    "post_year",
+    "comment_id",
+    "comment_likes",
+    "comment_date_unix",
+    "comment_year",
+    "comment_parent_id",
+}
+
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+}
+
+OUTPUT_LAYOUTS = ["flat", "normalized"]
+
+
+def pandas_dtypes(columns):
+    """Explicit pandas dtypes of the given raw dataset columns"""
+    dtypes = {}
+    for column in columns:
+        if column in CATEGORICAL_COLUMNS:
+            dtypes[column] = "category"
+        elif column in INT_COLUMNS:
+            dtypes[column] = "Int64"
+        else:
+            dtypes[column] = "string"
+    return dtypes
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    fields = []
+    for column in columns:
+        if column in CATEGORICAL_COLUMNS:
+            fields.append((column, pa.dictionary(pa.int32(), pa.string())))
+        elif column in INT_COLUMNS:
+            fields.append((column, pa.int64()))
+        else:
+            fields.append((column, pa.string()))
+    return pa.schema(fields)
+
+
+def output_path(path, output_format, layout="flat"):
+    """Returns where a dataset is written.
+
+    The flat layout is a single file with the extension of the output format,
+    the normalized layout is a directory with posts and comments tables.
+    """
+    if layout == "normalized":
+        return os.path.splitext(path)[0]
+    return os.path.splitext(path)[0] + OUTPUT_FORMATS[output_format]
+
+
+def normalized_table_paths(directory, output_format):
+    extension = OUTPUT_FORMATS[output_format]
+    return (
+        os.path.join(directory, "posts" + extension),
+        os.path.join(directory, "comments" + extension),
+    )
+
+
+def newest_normalized_tables(directory):
+    """Posts and comments tables of the most recently written format in `directory`, or None"""
+    written = [
+        normalized_table_paths(directory, output_format)
+        for output_format in OUTPUT_FORMATS
+        if os.path.exists(normalized_table_paths(directory, output_format)[0])
+    ]
+    if not written:
+        return None
+    return max(written, key=lambda tables: os.path.getmtime(tables[0]))
+
+
+def find_raw_dataset(path):
+    """Finds the most recently written dataset for `path` in any layout or format, or None.
+
+    Outputs of older runs in another layout or format may still lie next to
+    the current one, so the newest file wins rather than a fixed order.
+    """
+    base = os.path.splitext(path)[0]
+    candidates = []
+    if os.path.isdir(base):
+        tables = newest_normalized_tables(base)
+        if tables is not None:
+            candidates.append((os.path.getmtime(tables[0]), base))
+    for extension in OUTPUT_FORMATS.values():
+        if os.path.isfile(base + extension):
+            candidates.append((os.path.getmtime(base + extension), base + extension))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+def temporary_path(path):
+    """Where `path` is written before it replaces the previous output"""
+    return path + ".tmp"
+
+
+class CsvRecordWriter:
+    """Appends batches of records to a CSV file with the header written once"""
+
+    def __init__(self, path, columns=RECORD_COLUMNS):
+        self.path = path
+        self.columns = columns
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.header = True
+
+    def write(self, records):
+        df = pd.DataFrame(records, columns=self.columns)
+        df.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetRecordWriter:
+    """Writes batches of records as zstd-compressed Parquet row groups"""
+
+    def __init__(self, path, columns=RECORD_COLUMNS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+
+        self.pa = pa
+        self.path = path
+        self.schema = arrow_schema(columns)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, records):
+        table = self.pa.Table.from_pylist(records, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_record_writer(path, output_format="csv", columns=RECORD_COLUMNS):
+    if output_format == "parquet":
+        return ParquetRecordWriter(path, columns)
+    return CsvRecordWriter(path, columns)
+
+
+class DatasetSink:
+    """Buffers flat records and flushes them in bounded batches.
+
+    In the flat layout every record goes to one file; in the normalized
+    layout posts and comments go to separate tables in a directory. Records
+    go to temporary files next to the targets, which replace the targets on
+    close; an export that wrote no records leaves the previous output alone.
+    """
+
+    def __init__(self, path, output_format="csv", layout="flat", batch_size=5000):
+        self.path = path
+        self.output_format = output_format
+        self.layout = layout
+        self.batch_size = batch_size
+        self.writers = {}
+        self.batches = {}
+        self.records_written = 0
+
+        if layout == "normalized":
+            posts_path, comments_path = normalized_table_paths(path, output_format)
+            self.targets = {"post": posts_path, "comment": comments_path}
+            self.columns = {posts_path: POST_COLUMNS, comments_path: COMMENT_COLUMNS}
+        else:
+            self.targets = {"post": path, "comment": path}
+            self.columns = {path: RECORD_COLUMNS}
+
+    def write(self, record):
+        target = self.targets[record["type"]]
+        batch = self.batches.setdefault(target, [])
+        batch.append(record)
+        if len(batch) >= self.batch_size:
+            self._flush(target)
+
+    def _flush(self, target):
+        batch = self.batches.pop(target, [])
+        if not batch:
+            return
+        if target not in self.writers:
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            self.writers[target] = open_record_writer(
+                temporary_path(target), self.output_format, self.columns[target]
+            )
+        self.writers[target].write(batch)
+        self.records_written += len(batch)
+
+    def close(self):
+        try:
+            for target in list(self.batches):
+                self._flush(target)
+        except BaseException:
+            self.discard()
+            raise
+        for writer in self.writers.values():
+            writer.close()
+        if not self.records_written:
+            return
+
+        for target in self.writers:
+            os.replace(temporary_path(target), target)
+        # A table left by an earlier export must not pass for this one's
+        # (e.g. the comments of a run that collected none)
+        for target in set(self.targets.values()) - set(self.writers):
+            if os.path.isfile(target):
+                os.remove(target)
+
+    def discard(self):
+        """Drops everything written so far, the previous output stays in place"""
+        for target, writer in self.writers.items():
+            try:
+                writer.close()
+            finally:
+                if os.path.exists(temporary_path(target)):
+                    os.remove(temporary_path(target))
+        self.writers = {}
+        self.batches = {}
+
+
+def csv_read_options(columns=None):
+    """read_csv arguments that parse every column straight into its explicit dtype.
+
+    Only empty fields are missing values, so texts like "007", "1e5" or "NA"
+    are kept as written.
+    """
+    # Without `columns` every known column is typed, whichever of them the table has
+    typed = columns if columns is not None else RECORD_COLUMNS
+    return {
+        "encoding": "utf-8-sig",
+        "usecols": columns,
+        "dtype": pandas_dtypes(typed),
+        "keep_default_na": False,
+        "na_values": {column: [""] for column in typed},
+    }
+
+
+def read_table(path, columns=None):
+    """Reads one table with the explicit dtypes, optionally only some columns"""
+    if path.endswith(OUTPUT_FORMATS["parquet"]):
+        df = pd.read_parquet(path, columns=columns, dtype_backend="numpy_nullable")
+    else:
+        df = pd.read_csv(path, **csv_read_options(columns))
+    return df.astype(pandas_dtypes(df.columns))
+
+
+def iter_table(path, columns=None, chunk_size=100_000):
+    """Reads one table in chunks of up to `chunk_size` rows with the explicit dtypes"""
+    if path.endswith(OUTPUT_FORMATS["parquet"]):
+        import pyarrow.parquet as pq
+
+        chunks = (
+            batch.to_pandas()
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns)
+        )
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_size, **csv_read_options(columns))
+    for df in chunks:
+        yield df.astype(pandas_dtypes(df.columns))
+
+
+def iter_raw_dataset(path, columns=None, chunk_size=100_000):
+    """Reads a dataset in the flat record layout chunk by chunk, like read_raw_dataset"""
+    columns = list(columns or RECORD_COLUMNS)
+
+    if not os.path.isdir(path):
+        yield from iter_table(path, columns, chunk_size)
+        return
+
+    tables = newest_normalized_tables(path)
+    if tables is None:
+        raise FileNotFoundError(f"No posts table in {path}")
+    posts_path, comments_path = tables
+
+    tables = [("post", posts_path, POST_COLUMNS), ("comment", comments_path, COMMENT_COLUMNS)]
+    for record_type, table_path, table_columns in tables:
+        if not os.path.exists(table_path):
+            continue
+        for df in iter_table(table_path, [c for c in table_columns if c in columns], chunk_size):
+            df.insert(0, "type", record_type)
+            df = df.reindex(columns=[c for c in RECORD_COLUMNS if c in columns])
+            yield df.astype(pandas_dtypes(df.columns))
+
+
+def read_raw_dataset(path, columns=None):
+    """Reads a dataset in the flat record layout.
+
+    A normalized dataset is read table by table and stacked into the flat
+    columns, without repeating the post text on comment rows. With `columns`
+    only those columns are read from disk.
+    """
+    columns = list(columns or RECORD_COLUMNS)
+
+    if not os.path.isdir(path):
+        return read_table(path, columns)
+
+    tables = newest_normalized_tables(path)
+    if tables is None:
+        raise FileNotFoundError(f"No posts table in {path}")
+    posts_path, comments_path = tables
+
+    posts = read_table(posts_path, [c for c in POST_COLUMNS if c in columns])
+    posts.insert(0, "type", "post")
+    frames = [posts]
+    if os.path.exists(comments_path):
+        comments = read_table(comments_path, [c for c in COMMENT_COLUMNS if c in columns])
+        comments.insert(0, "type", "comment")
+        frames.append(comments)
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.reindex(columns=[c for c in RECORD_COLUMNS if c in columns])
+    return df.astype(pandas_dtypes(df.columns))
@@ -0,0 +1,329 @@
+"""
+Накопленные результаты tuvan_detector.py.
+
+В SQLite хранятся метки уже обработанных строк сырых датасетов и счётчики
+по (категория, группа, год, месяц, тип, метка) - тот же куб, что строит
+build_cube в tuvan_detector.py. При следующем запуске классифицируются
+только строки, которых ещё нет в хранилище, а счётчики увеличиваются на их
+метки, поэтому results_*.csv пересобираются из счётчиков без повторного
+анализа всего датасета. Строки, которых после перезаписи датасета сборщиком
+в нём больше нет, удаляются из хранилища вместе со своими метками в счётчиках.
+Строки с изменившимся текстом (по хэшу текста) удаляются и размечаются заново.
+"""
+import os
+import sqlite3
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from classification_cache import text_key
+
+# Колонки, по которым строка датасета узнаётся при следующих запусках
+ROW_KEY_COLUMNS = ['category', 'group', 'type', 'post_id', 'comment_id']
+
+# Измерения куба результатов, у каждой комбинации - колонка count
+CUBE_DIMENSIONS = ['category', 'group', 'year', 'month', 'type', 'language_category']
+
+# Увеличивается при изменении таблиц; хранилище другой версии создаётся заново
+SCHEMA_VERSION = 3
+
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+SCHEMA = """
+-- comment_id = 0 у постов, month = 0 если месяц неизвестен
+CREATE TABLE IF NOT EXISTS labelled_rows (
+    group_name TEXT NOT NULL,
+    row_type TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    comment_id INTEGER NOT NULL,
+    category TEXT,
+    year INTEGER,
+    month INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    -- text_key текста в нижнем регистре: изменённый текст размечается заново
+    text_hash BLOB,
+    PRIMARY KEY (group_name, row_type, post_id, comment_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS aggregates (
+    category TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    row_type TEXT NOT NULL,
+    label TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (category, group_name, year, month, row_type, label)
+);
+
+-- Категории, которые были в датасете results_<dataset>.csv
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (dataset, category)
+);
+"""
+
+# Ключи строк текущего куска и всех строк текущего прохода по датасету
+# (только для этого соединения)
+TEMP_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS chunk_keys (
+    position INTEGER PRIMARY KEY,
+    group_name TEXT, row_type TEXT, post_id INTEGER, comment_id INTEGER, text_hash BLOB
+);
+
+CREATE TEMP TABLE IF NOT EXISTS seen_keys (
+    group_name TEXT, row_type TEXT, post_id INTEGER, comment_id INTEGER,
+    PRIMARY KEY (group_name, row_type, post_id, comment_id)
+) WITHOUT ROWID;
+"""
+
+def row_keys(df):
+    """Ключи строк датасета в виде (группа, тип, пост, комментарий)"""
+    return list(zip(
+        df['group'].astype(str),
+        df['type'].astype(str),
+        pd.to_numeric(df['post_id'], errors='coerce').fillna(0).astype('int64'),
+        pd.to_numeric(df['comment_id'], errors='coerce').fillna(0).astype('int64'),
+    ))
+
+def row_texts(df):
+    """Тексты строк датасета: поста или комментария, по типу строки"""
+    is_post = (df['type'].astype(str) == 'post').to_numpy(dtype=bool)
+    return np.where(
+        is_post,
+        df['post_text'].to_numpy(dtype=object, na_value=None),
+        df['comment_text'].to_numpy(dtype=object, na_value=None),
+    )
+
+def text_hashes(texts):
+    """text_key текстов в нижнем регистре, None для пропусков"""
+    return [None if pd.isna(text) else text_key(str(text).lower()) for text in texts]
+
+class ResultStore:
+    """Метки строк и счётчики для версии правил rules_version"""
+
+    def __init__(self, path, rules_version):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(META_SCHEMA)
+        self._check_schema_version()
+        self.conn.executescript(SCHEMA)
+        self.conn.executescript(TEMP_SCHEMA)
+        self._check_rules_version(rules_version)
+
+    def _check_schema_version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row and int(row[0]) == SCHEMA_VERSION:
+            return
+        # Таблицы старой версии пересоздаются, строки будут размечены заново
+        with self.conn:
+            for table in ('labelled_rows', 'aggregates', 'datasets'):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)
+            )
+
+    def _check_rules_version(self, rules_version):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'rules_version'").fetchone()
+        if row and row[0] == rules_version:
+            return
+        # Метки по другим правилам не годятся, всё считается заново
+        self.clear()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('rules_version', ?)",
+                (rules_version,),
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM labelled_rows")
+            self.conn.execute("DELETE FROM aggregates")
+            self.conn.execute("DELETE FROM datasets")
+
+    def start_scan(self):
+        """Начинает проход по датасету: ключи строк, переданных в new_rows, запоминаются"""
+        with self.conn:
+            self.conn.execute("DELETE FROM seen_keys")
+
+    def remove_unseen_rows(self, categories):
+        """
+        Удаляет строки этих категорий, которых не было среди строк прохода
+        (см. start_scan), и вычитает их метки из счётчиков. Возвращает их число.
+        """
+        categories = list(categories)
+        if not categories:
+            return 0
+        placeholders = ','.join('?' * len(categories))
+        with self.conn:
+            return self._remove_rows(
+                f"""
+                SELECT * FROM labelled_rows r
+                WHERE r.category IN ({placeholders}) AND NOT EXISTS (
+                    SELECT 1 FROM seen_keys s
+                    WHERE s.group_name = r.group_name AND s.row_type = r.row_type
+                      AND s.post_id = r.post_id AND s.comment_id = r.comment_id
+                )
+                """,
+                categories,
+            )
+
+    def _remove_rows(self, select, params=()):
+        """Удаляет строки labelled_rows, выбранные запросом select, вместе с их метками в счётчиках"""
+        self.conn.execute("DROP TABLE IF EXISTS removed_rows")
+        self.conn.execute(f"CREATE TEMP TABLE removed_rows AS {select}", params)
+        removed = self.conn.execute("SELECT COUNT(*) FROM removed_rows").fetchone()[0]
+        if removed:
+            self.conn.execute(
+                """
+                UPDATE aggregates SET count = count - (
+                    SELECT COUNT(*) FROM removed_rows u
+                    WHERE u.category = aggregates.category AND u.group_name = aggregates.group_name
+                      AND u.year = aggregates.year AND u.month = aggregates.month
+                      AND u.row_type = aggregates.row_type AND u.label = aggregates.label
+                )
+                WHERE EXISTS (
+                    SELECT 1 FROM removed_rows u
+                    WHERE u.category = aggregates.category AND u.group_name = aggregates.group_name
+                )
+                """
+            )
+            self.conn.execute("DELETE FROM aggregates WHERE count <= 0")
+            self.conn.execute(
+                """
+                DELETE FROM labelled_rows
+                WHERE (group_name, row_type, post_id, comment_id) IN (
+                    SELECT group_name, row_type, post_id, comment_id FROM removed_rows
+                )
+                """
+            )
+        self.conn.execute("DROP TABLE removed_rows")
+        return removed
+
+    def new_rows(self, df):
+        """
+        Маска строк df, которых ещё нет в хранилище. Строки, текст которых
+        изменился, удаляются из хранилища и тоже считаются новыми.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM chunk_keys")
+            self.conn.executemany(
+                "INSERT INTO chunk_keys VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (i, *key, text_hash)
+                    for i, (key, text_hash) in enumerate(zip(row_keys(df), text_hashes(row_texts(df))))
+                ),
+            )
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO seen_keys
+                SELECT group_name, row_type, post_id, comment_id FROM chunk_keys
+                """
+            )
+            self._remove_rows(
+                """
+                SELECT DISTINCT r.* FROM chunk_keys k
+                JOIN labelled_rows r
+                  ON r.group_name = k.group_name AND r.row_type = k.row_type
+                 AND r.post_id = k.post_id AND r.comment_id = k.comment_id
+                WHERE r.text_hash IS NOT k.text_hash
+                """
+            )
+            rows = self.conn.execute(
+                """
+                SELECT k.position FROM chunk_keys k
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM labelled_rows r
+                    WHERE r.group_name = k.group_name AND r.row_type = k.row_type
+                      AND r.post_id = k.post_id AND r.comment_id = k.comment_id
+                )
+                """
+            )
+            mask = [False] * len(df)
+            for (position,) in rows:
+                mask[position] = True
+        return mask
+
+    def add_rows(self, df):
+        """
+        Сохраняет метки новых строк (колонки year, month и language_category)
+        и добавляет их к счётчикам. Повторы одной строки считаются один раз.
+        """
+        keys = row_keys(df)
+        categories = df['category'].astype(str).tolist()
+        years = pd.to_numeric(df['year'], errors='coerce').astype('Int64').tolist()
+        months = pd.to_numeric(df['month'], errors='coerce').fillna(0).astype('int64').tolist()
+        labels = df['language_category'].tolist()
+        hashes = text_hashes(row_texts(df))
+
+        rows = {}
+        for key, category, year, month, label, text_hash in zip(
+            keys, categories, years, months, labels, hashes
+        ):
+            rows.setdefault(key, (category, None if pd.isna(year) else int(year), month, label, text_hash))
+
+        counts = Counter(
+            (category, key[0], year, month, key[1], label)
+            for key, (category, year, month, label, _) in rows.items()
+            if year is not None
+        )
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO labelled_rows
+                    (group_name, row_type, post_id, comment_id, category, year, month, label, text_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                ((*key, *value) for key, value in rows.items()),
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO aggregates (category, group_name, year, month, row_type, label, count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (category, group_name, year, month, row_type, label)
+                DO UPDATE SET count = count + excluded.count
+                """,
+                ((*key, count) for key, count in counts.items()),
+            )
+
+    def set_dataset_categories(self, dataset, categories):
+        with self.conn:
+            self.conn.execute("DELETE FROM datasets WHERE dataset = ?", (dataset,))
+            self.conn.executemany(
+                "INSERT INTO datasets (dataset, category) VALUES (?, ?)",
+                [(dataset, category) for category in categories],
+            )
+
+    def dataset_categories(self, dataset):
+        rows = self.conn.execute("SELECT category FROM datasets WHERE dataset = ?", (dataset,))
+        return [category for (category,) in rows]
+
+    def cube(self, categories):
+        """Куб результатов (CUBE_DIMENSIONS и count) для строк этих категорий"""
+        categories = list(categories)
+        rows = self.conn.execute(
+            f"""
+            SELECT category, group_name, year, month, row_type, label, count FROM aggregates
+            WHERE category IN ({','.join('?' * len(categories))})
+            ORDER BY category, group_name, year, month, row_type, label
+            """,
+            categories,
+        ).fetchall()
+        cube = pd.DataFrame(rows, columns=CUBE_DIMENSIONS + ['count'])
+        cube['year'] = cube['year'].astype('Int64')
+        cube['month'] = cube['month'].astype('Int64').replace(0, pd.NA)
+        return cube
@@ -0,0 +1,153 @@
+"""
+Один файл с результатами всех источников для дашборда.
+
+Вместо трёх CSV дашборд загружает results_bundle.json: колонки уже
+числовые, строки (источник, год, тип) хранятся по колонкам, категории -
+номерами в списках измерений, а для фильтров заранее посчитаны номера
+строк по году, типу и источнику. Если рядом с results_*.csv лежат кубы
+cube_*.csv, в файл попадают и счётчики по группам и месяцам.
+
+    python results_bundle.py --results-dir assets --output assets/results_bundle.json
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+
+BUNDLE_FORMAT = 'tuvan-results-bundle'
+
+# Увеличивается при несовместимых изменениях, дашборд проверяет версию
+BUNDLE_VERSION = 1
+
+RESULTS_DIR = '../dataset/results'
+BUNDLE_FILE = os.path.join(RESULTS_DIR, 'results_bundle.json')
+
+# Источник дашборда -> датасет, в том же порядке, что CSV_FILES в csv-data.service.ts
+SOURCES = [
+    ('community', 'community_media_posts'),
+    ('government', 'gov_institutions_posts'),
+    ('official', 'official_media_posts'),
+]
+
+# Колонки results_*.csv -> колонки строк дашборда (DataRow)
+ROW_COLUMNS = {
+    'Всего': 'total',
+    'Тувинский_ңөү_кол': 'tuvanNguCol',
+    'Тувинский_ңөү_%': 'tuvanNguPercent',
+    'Тувинский_рус_клав_кол': 'tuvanRusCol',
+    'Тувинский_рус_клав_%': 'tuvanRusPercent',
+    'Русский_кол': 'russianCol',
+    'Русский_%': 'russianPercent',
+}
+
+# Типы строк сырых данных -> типы в results_*.csv
+TYPE_NAMES = {'post': 'Посты', 'comment': 'Комментарии'}
+
+def codes(values, dimension):
+    """Номера значений в списке измерения"""
+    positions = {value: i for i, value in enumerate(dimension)}
+    return [positions[value] for value in values]
+
+def postings(values):
+    """Номера строк для каждого значения: {значение: [номера строк]}"""
+    index = {}
+    for row, value in enumerate(values):
+        index.setdefault(str(value), []).append(row)
+    return index
+
+def read_sources(results_dir):
+    """Результаты и кубы (если есть) всех источников с колонкой source"""
+    results = []
+    cubes = []
+    for source, dataset in SOURCES:
+        results_file = os.path.join(results_dir, f'results_{dataset}.csv')
+        if not os.path.exists(results_file):
+            print(f"Нет результатов {results_file}, источник {source} пропущен")
+            continue
+        results.append(pd.read_csv(results_file, encoding='utf-8-sig').assign(source=source))
+
+        cube_file = os.path.join(results_dir, f'cube_{dataset}.csv')
+        if os.path.exists(cube_file):
+            cubes.append(pd.read_csv(cube_file, encoding='utf-8-sig').assign(source=source))
+    return results, cubes
+
+def build_cube_columns(cubes, dimensions):
+    """Счётчики a/b/c по (источник, группа, год, месяц, тип) в виде колонок"""
+    columns = {name: [] for name in ('source', 'group', 'year', 'month', 'type', 'a', 'b', 'c')}
+    if not cubes:
+        return columns
+
+    cube = pd.concat(cubes, ignore_index=True)
+    cube['type'] = cube['type'].map(TYPE_NAMES)
+    cube['month'] = cube['month'].fillna(0).astype(int)
+    cube = cube[cube['type'].notna()]
+    table = cube.pivot_table(
+        index=['source', 'group', 'year', 'month', 'type'], columns='label',
+        values='count', aggfunc='sum', fill_value=0,
+    ).reindex(columns=['a', 'b', 'c'], fill_value=0).reset_index()
+
+    dimensions['group'] = sorted(table['group'].astype(str).unique())
+    columns['source'] = codes(table['source'], dimensions['source'])
+    columns['group'] = codes(table['group'].astype(str), dimensions['group'])
+    columns['year'] = table['year'].astype(int).tolist()
+    columns['month'] = table['month'].astype(int).tolist()
+    columns['type'] = codes(table['type'], dimensions['type'])
+    for label in 'abc':
+        columns[label] = table[label].astype(int).tolist()
+    return columns
+
+def build_bundle(results_dir=RESULTS_DIR):
+    results, cubes = read_sources(results_dir)
+    rows = pd.concat(results, ignore_index=True) if results else pd.DataFrame(
+        columns=['Год', 'Тип', 'source'] + list(ROW_COLUMNS)
+    )
+
+    dimensions = {
+        'source': [source for source, _ in SOURCES],
+        'type': sorted(set(rows['Тип']) | set(TYPE_NAMES.values())),
+        'year': sorted(int(year) for year in rows['Год'].unique()),
+        'group': [],
+    }
+
+    row_columns = {
+        'source': codes(rows['source'], dimensions['source']),
+        'year': rows['Год'].astype(int).tolist(),
+        'type': codes(rows['Тип'], dimensions['type']),
+    }
+    for csv_column, column in ROW_COLUMNS.items():
+        values = rows[csv_column]
+        row_columns[column] = (
+            values.astype(float).tolist() if column.endswith('Percent') else values.astype(int).tolist()
+        )
+
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'dimensions': dimensions,
+        'rows': row_columns,
+        'indexes': {
+            'year': postings(row_columns['year']),
+            'type': postings(rows['Тип']),
+            'source': postings(rows['source']),
+        },
+        'cube': build_cube_columns(cubes, dimensions),
+    }
+
+def write_bundle(results_dir=RESULTS_DIR, output_file=BUNDLE_FILE):
+    bundle = build_bundle(results_dir)
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, output_file)
+    print(f"\nДанные для дашборда сохранены в: {output_file}")
+    return bundle
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Собирает results_bundle.json для дашборда")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="папка с results_*.csv и cube_*.csv")
+    parser.add_argument("--output", default=BUNDLE_FILE, help="файл для дашборда")
+    args = parser.parse_args()
+    write_bundle(args.results_dir, args.output)
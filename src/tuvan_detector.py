@@ -1,14 +1,155 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import numpy as np
 import pandas as pd
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from classification_cache import ClassificationCache, text_key
+from raw_dataset import find_raw_dataset, iter_raw_dataset, read_raw_dataset
+from result_store import CUBE_DIMENSIONS, ROW_KEY_COLUMNS, ResultStore
+from results_bundle import write_bundle
 
 TUVAN_CHARS = set('ңөүҢӨҮ')
+TUVAN_CHARS_RE = '[' + ''.join(sorted(TUVAN_CHARS)) + ']'
+
+# Колонки сырого датасета, которые нужны для классификации
+DATASET_COLUMNS = [
+    'type', 'category', 'group', 'post_year', 'comment_year',
+    'post_date', 'comment_date', 'post_text', 'comment_text',
+]
 
 def contains_tuvan_chars(text):
     if pd.isna(text):
         return False
     return any(char in TUVAN_CHARS for char in str(text))
 
+# Характерные тувинские слова/паттерны без спецбукв. Поддерживаются три вида
+# паттернов: целое слово \bслово\b, суффикс \w+суффикс\b и префикс \bпрефикс\w+\b;
+# остальные проверяются как обычные регулярные выражения
+TUVAN_KEYBOARD_PATTERNS = [
+    # Местоимения и частые слова
+    r'\bмен\b', r'\bсен\b', r'\bбис\b', r'\bсилер\b',
+    r'\bчуве\b', r'\bчок\b', r'\bбар\b', r'\bтур\b',
+    r'\bболур\b', r'\bдээш\b', r'\bкылыр\b',
+    
+    # Часто встречающиеся слова
+    r'\bбистин\b', r'\bмээн\b', r'\bсилернин\b', 
+    r'\bачамнын\b', r'\bавамнын\b', r'\bачазы\b', r'\bавазы\b',
+    r'\bооренир\b', r'\bооренип\b', r'\bооредилге\b', r'\bоршээ\b',
+    r'\bог-буле\b', r'\bтыванын\b', r'\bог-буленин\b', 
+    r'\bог-булезинге\b', r'\bог-булелиг\b',
+    r'\bменээ\b', r'\bортек\b', r'\bортээ\b',
+    r'\bкожууннун\b', r'\bторуттунген\b',
+    r'\bчуректиг\b', r'\bчуректеривиске\b', r'\bчурек\b', r'\bчуректер\b',
+    r'\bмонгеде\b', r'\bсоолгу\b', r'\bулегер\b',
+    r'\bбригадазынын\b', r'\bоглувустун\b', r'\bсумузунун\b', r'\bозуп\b',
+    
+    # Характерные суффиксы и окончания тувинского языка
+    r'\w+нын\b',      # родительный падеж: кожууннун, ачамнын
+    r'\w+зы\b',       # притяжательный: ачазы, авазы
+    r'\w+ынын\b',     # родительный: бригадазынын
+    r'\w+устун\b',    # оглувустун
+    r'\w+узунун\b',   # сумузунун
+    r'\w+ээ\b',       # оршээ, менээ, ортээ
+    r'\w+иг\b',       # чуректиг, ог-булелиг
+    r'\w+иске\b',     # чуректеривиске
+    r'\w+илге\b',     # ооредилге
+    r'\bоо\w+\b',     # слова начинающиеся с "оо": ооренир, ооренип
+]
+
+TOKEN_RE = re.compile(r'\w+')
+WORD_CHARS_RE = re.compile(r'\w+$')
+WORD_PATTERN_RE = re.compile(r'\\b(\w+)\\b$')
+SUFFIX_PATTERN_RE = re.compile(r'\\w\+(\w+)\\b$')
+PREFIX_PATTERN_RE = re.compile(r'\\b(\w+)\\w\+\\b$')
+
+class KeyboardPatternMatcher:
+    """
+    Проверяет все паттерны за один проход по тексту.
+    
+    Текст один раз разбивается на слова (\w+, как в \b и \w у re), дальше:
+    - \bслово\b - слово целиком есть среди слов текста (поиск в множестве);
+    - \w+суффикс\b - слово длиннее суффикса и заканчивается им;
+    - \bпрефикс\w+\b - слово длиннее префикса и начинается с него.
+    Остальные паттерны (например, слова через дефис) объединяются в одно
+    регулярное выражение. Решения совпадают с поочерёдным re.search по
+    каждому паттерну.
+    """
+    
+    def __init__(self, patterns):
+        self.words = set()
+        self.suffixes = defaultdict(set)
+        self.prefixes = defaultdict(set)
+        other = []
+        
+        for pattern in patterns:
+            word = WORD_PATTERN_RE.match(pattern)
+            suffix = SUFFIX_PATTERN_RE.match(pattern)
+            prefix = PREFIX_PATTERN_RE.match(pattern)
+            if word:
+                self.words.add(word.group(1))
+            elif suffix:
+                self.suffixes[len(suffix.group(1))].add(suffix.group(1))
+            elif prefix:
+                self.prefixes[len(prefix.group(1))].add(prefix.group(1))
+            else:
+                other.append(f'(?:{pattern})')
+        
+        self.other = re.compile('|'.join(other)) if other else None
+    
+    def matches_token(self, token):
+        if token in self.words:
+            return True
+        length = len(token)
+        for n, suffixes in self.suffixes.items():
+            if length > n and token[-n:] in suffixes:
+                return True
+        for n, prefixes in self.prefixes.items():
+            if length > n and token[:n] in prefixes:
+                return True
+        return False
+    
+    def matches(self, text_lower):
+        for token in set(TOKEN_RE.findall(text_lower)):
+            if self.matches_token(token):
+                return True
+        return self.other is not None and self.other.search(text_lower) is not None
+
+TUVAN_KEYBOARD_MATCHER = KeyboardPatternMatcher(TUVAN_KEYBOARD_PATTERNS)
+
+# Увеличивается при изменении логики classify_text; вместе с буквами и
+# паттернами определяет версию правил, при смене которой кэш меток сбрасывается
+CLASSIFIER_REVISION = 1
+RULES_VERSION = hashlib.sha1(json.dumps(
+    [CLASSIFIER_REVISION, sorted(TUVAN_CHARS), TUVAN_KEYBOARD_PATTERNS], ensure_ascii=False
+).encode('utf-8')).hexdigest()
+
+CACHE_FILE = '../dataset/results/classification_cache.sqlite'
+RESULT_STORE_NAME = 'results_store.sqlite'
+
+# Папки сборщика: полный сбор, --sample-per-year пишет в ../dataset/sample
+RAW_DIR = '../dataset/raw'
+RESULTS_DIR = '../dataset/results'
+DATASET_FILES = [
+    'official_media_posts.csv',
+    'community_media_posts.csv',
+    'gov_institutions_posts.csv',
+]
+
+# Открытые кэши процесса по пути, в том числе в процессах пула
+_caches = {}
+
+def open_cache(cache_path):
+    if cache_path is None:
+        return None
+    if cache_path not in _caches:
+        _caches[cache_path] = ClassificationCache(cache_path, RULES_VERSION)
+    return _caches[cache_path]
+
 def is_tuvan_with_russian_keyboard(text):
     """
     Эвристическая проверка тувинского языка с русской клавиатурой.
@@ -17,48 +158,7 @@ def is_tuvan_with_russian_keyboard(text):
     if pd.isna(text):
         return False
     
-    text_lower = str(text).lower()
-    
-    # Характерные тувинские слова/паттерны без спецбукв
-    tuvan_words = [
-        # Местоимения и частые слова
-        r'\bмен\b', r'\bсен\b', r'\bбис\b', r'\bсилер\b',
-        r'\bчуве\b', r'\bчок\b', r'\bбар\b', r'\bтур\b',
-        r'\bболур\b', r'\bдээш\b', r'\bкылыр\b',
-        
-        # Часто встречающиеся слова
-        r'\bбистин\b', r'\bмээн\b', r'\bсилернин\b', 
-        r'\bачамнын\b', r'\bавамнын\b', r'\bачазы\b', r'\bавазы\b',
-        r'\bооренир\b', r'\bооренип\b', r'\bооредилге\b', r'\bоршээ\b',
-        r'\bог-буле\b', r'\bтыванын\b', r'\bог-буленин\b', 
-        r'\bог-булезинге\b', r'\bог-булелиг\b',
-        r'\bменээ\b', r'\bортек\b', r'\bортээ\b',
-        r'\bкожууннун\b', r'\bторуттунген\b',
-        r'\bчуректиг\b', r'\bчуректеривиске\b', r'\bчурек\b', r'\bчуректер\b',
-        r'\bмонгеде\b', r'\bсоолгу\b', r'\bулегер\b',
-        r'\bбригадазынын\b', r'\bоглувустун\b', r'\bсумузунун\b', r'\bозуп\b',
-        
-        # Характерные суффиксы и окончания тувинского языка
-        r'\w+нын\b',      # родительный падеж: кожууннун, ачамнын
-        r'\w+зы\b',       # притяжательный: ачазы, авазы
-        r'\w+ынын\b',     # родительный: бригадазынын
-        r'\w+устун\b',    # оглувустун
-        r'\w+узунун\b',   # сумузунун
-        r'\w+ээ\b',       # оршээ, менээ, ортээ
-        r'\w+иг\b',       # чуректиг, ог-булелиг
-        r'\w+иске\b',     # чуректеривиске
-        r'\w+илге\b',     # ооредилге
-        r'\bоо\w+\b',     # слова начинающиеся с "оо": ооренир, ооренип
-    ]
-    
-    matches = 0
-    for pattern in tuvan_words:
-        if re.search(pattern, text_lower):
-            matches += 1
-            if matches >= 1:
-                return True
-    
-    return False
+    return TUVAN_KEYBOARD_MATCHER.matches(str(text).lower())
 
 def classify_text(text):
     """
@@ -81,7 +181,73 @@ def classify_text(text):
     else:
         return 'c'  # Русский
 
-def analyze_dataset(file_path):
+def classify_texts(texts, cache=None):
+    """
+    Классифицирует целую колонку текстов, метки совпадают с classify_text.
+    Тувинские буквы ищутся одним str.contains по классу символов, а
+    паттерны русской клавиатуры проверяются по одному разу для каждого
+    уникального текста. С кэшем классифицируются только тексты, которых
+    в нём ещё нет.
+    """
+    texts = pd.Series(texts)
+    labels = np.full(len(texts), 'c', dtype=object)
+    
+    present = texts.notna().to_numpy()
+    strings = texts[present].astype(str)
+    # Нижний регистр - через str.lower, как в classify_text: строковый dtype
+    # pandas 3 переводит 'İ' в нижний регистр иначе
+    if cache is not None:
+        codes, uniques = pd.factorize(strings.map(str.lower))
+        labels[present] = classify_unique_texts(np.asarray(uniques, dtype=object), cache)[codes]
+        return pd.Series(labels, index=texts.index)
+    
+    has_tuvan_chars = strings.str.contains(TUVAN_CHARS_RE, regex=True).to_numpy(dtype=bool)
+    
+    rest = strings[~has_tuvan_chars].map(str.lower)
+    codes, uniques = pd.factorize(rest)
+    keyboard = np.fromiter(
+        (TUVAN_KEYBOARD_MATCHER.matches(text) for text in uniques), dtype=bool, count=len(uniques)
+    )
+    
+    present_labels = np.where(has_tuvan_chars, 'a', 'c').astype(object)
+    present_labels[~has_tuvan_chars] = np.where(keyboard[codes], 'b', 'c')
+    labels[present] = present_labels
+    return pd.Series(labels, index=texts.index)
+
+def classify_unique_texts(texts_lower, cache):
+    """Метки различных текстов в нижнем регистре: из кэша или классифицированные заново"""
+    keys = [text_key(text) for text in texts_lower]
+    known = cache.get_many(keys)
+    labels = np.array([known.get(key) for key in keys], dtype=object)
+    
+    missing = np.flatnonzero([key not in known for key in keys])
+    if len(missing):
+        new_labels = classify_texts(pd.Series(texts_lower[missing], dtype=object)).to_numpy()
+        labels[missing] = new_labels
+        cache.put_many(zip((keys[i] for i in missing), new_labels))
+    return labels
+
+def is_raw_csv(file_path, columns):
+    """CSV, записанный сборщиком: в UTF-8 с BOM и со всеми нужными колонками в заголовке"""
+    try:
+        with open(file_path, encoding='utf-8-sig', newline='') as f:
+            header = next(csv.reader(f), [])
+    except (OSError, UnicodeDecodeError):
+        return False
+    return set(columns) <= set(header)
+
+def read_dataset(file_path):
+    # Нормализованный датасет (папка с таблицами постов и комментариев),
+    # Parquet и CSV сборщика читаются строгим парсером без потери строк,
+    # CSV-файлы старого формата - как раньше
+    if os.path.isdir(file_path) or not file_path.endswith('.csv'):
+        return read_raw_dataset(file_path, DATASET_COLUMNS)
+    if is_raw_csv(file_path, DATASET_COLUMNS):
+        try:
+            return read_raw_dataset(file_path, DATASET_COLUMNS)
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            print(f"Файл {file_path} не читается строгим парсером ({e}), читаем как старый CSV")
+    
     try:
         # Пробуем с разными параметрами для корректного чтения многострочных полей
         df = pd.read_csv(file_path, encoding='utf-8', quoting=1, escapechar='\\', on_bad_lines='skip')
@@ -93,33 +259,203 @@ def analyze_dataset(file_path):
                 df = pd.read_csv(file_path, encoding='utf-8-sig', quoting=1, escapechar='\\', on_bad_lines='skip')
             except Exception as e:
                 print(f"Ошибка при чтении файла {file_path}: {e}")
-                return {}
+                return None
+    return df
+
+def csv_encoding(file_path):
+    """Первая кодировка, в которой читается весь файл (в том же порядке, что в read_dataset)"""
+    for encoding in ('utf-8', 'cp1251', 'utf-8-sig'):
+        try:
+            with open(file_path, encoding=encoding) as f:
+                while f.read(1 << 20):
+                    pass
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+def iter_dataset_chunks(file_path, chunk_size, columns=DATASET_COLUMNS):
+    """Читает датасет кусками по chunk_size строк, только нужные для анализа колонки"""
+    if os.path.isdir(file_path) or not file_path.endswith('.csv') or is_raw_csv(file_path, columns):
+        return iter_raw_dataset(file_path, columns, chunk_size)
     
-    df['year'] = df.apply(lambda row: row['post_year'] if row['type'] == 'post' else row['comment_year'], axis=1)
-    df['text'] = df.apply(lambda row: row['post_text'] if row['type'] == 'post' else row['comment_text'], axis=1)
+    encoding = csv_encoding(file_path)
+    if encoding is None:
+        print(f"Ошибка при чтении файла {file_path}: неизвестная кодировка")
+        return None
+    return pd.read_csv(
+        file_path, encoding=encoding, quoting=1, escapechar='\\', on_bad_lines='skip',
+        usecols=lambda column: column in columns, chunksize=chunk_size,
+    )
+
+def label_rows(df, cache=None):
+    """Добавляет к строкам датасета колонки year, month, text и language_category"""
+    # Год, месяц и текст берутся из колонок поста или комментария по типу строки
+    is_post = (df['type'] == 'post').to_numpy(dtype=bool, na_value=False)
+    df['year'] = np.where(
+        is_post,
+        pd.to_numeric(df['post_year'], errors='coerce').to_numpy(dtype=float, na_value=np.nan),
+        pd.to_numeric(df['comment_year'], errors='coerce').to_numpy(dtype=float, na_value=np.nan),
+    )
+    # Даты записаны как 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' в том же времени, что и год
+    dates = pd.Series(np.where(
+        is_post,
+        df['post_date'].to_numpy(dtype=object, na_value=None),
+        df['comment_date'].to_numpy(dtype=object, na_value=None),
+    ), index=df.index, dtype=object)
+    df['month'] = pd.to_numeric(dates.str.slice(5, 7), errors='coerce')
+    df['text'] = np.where(
+        is_post,
+        df['post_text'].to_numpy(dtype=object, na_value=None),
+        df['comment_text'].to_numpy(dtype=object, na_value=None),
+    )
     
-    df['language_category'] = df['text'].apply(classify_text)
+    df['language_category'] = classify_texts(df['text'], cache)
+    return df
+
+def build_cube(df):
+    """
+    Куб результатов размеченных строк: число строк для каждого сочетания
+    категории, группы, года, месяца, типа и метки, одной группировкой.
+    Строки без года в куб не попадают, как и в результаты по годам.
+    """
+    keys = pd.DataFrame({
+        dimension: df[dimension].to_numpy(dtype=object, na_value=None) if dimension in df else None
+        for dimension in ('category', 'group', 'type')
+    }, index=df.index)
+    keys['year'] = df['year'].astype('Int64')
+    keys['month'] = df['month'].astype('Int64')
+    keys['language_category'] = df['language_category']
     
+    cube = keys.groupby(CUBE_DIMENSIONS, dropna=False).size().reset_index(name='count')
+    return cube[cube['year'].notna()].reset_index(drop=True)
+
+def merge_cubes(cubes):
+    """Складывает кубы частей датасета"""
+    cubes = [cube for cube in cubes if len(cube)]
+    if not cubes:
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ['count'])
+    merged = pd.concat(cubes, ignore_index=True)
+    return merged.groupby(CUBE_DIMENSIONS, dropna=False)['count'].sum().reset_index()
+
+def slice_cube(cube, **filters):
+    """Часть куба, например slice_cube(cube, group='tuva_online', month=5)"""
+    mask = np.ones(len(cube), dtype=bool)
+    for dimension, value in filters.items():
+        mask &= (cube[dimension] == value).to_numpy(dtype=bool, na_value=False)
+    return cube[mask]
+
+def results_from_counts(years, counts):
+    """Собирает словарь результатов analyze_dataset из счётчиков (год, тип, категория)"""
     results = {}
-    
-    # Группировка по годам
-    for year in sorted(df['year'].dropna().unique()):
-        year_data = df[df['year'] == year]
-        
-        # Разделение на посты и комментарии
-        posts = year_data[year_data['type'] == 'post']
-        comments = year_data[year_data['type'] == 'comment']
-        
-        results[int(year)] = {
-            'posts': analyze_group(posts),
-            'comments': analyze_group(comments)
+    for year in sorted(years):
+        results[year] = {
+            'posts': summarize_counts(*(counts[(year, 'post', label)] for label in 'abc')),
+            'comments': summarize_counts(*(counts[(year, 'comment', label)] for label in 'abc')),
         }
-    
     return results
 
-def analyze_group(data):
-    """Анализирует группу данных (посты или комментарии)"""
-    total = len(data)
+def results_from_cube(cube):
+    """Словарь результатов по годам (как у analyze_dataset) для куба или его части"""
+    counts = Counter()
+    grouped = cube.groupby(['year', 'type', 'language_category'])['count'].sum()
+    for (year, row_type, label), count in grouped.items():
+        counts[(int(year), row_type, label)] = int(count)
+    years = {int(year) for year in cube['year'].unique()}
+    return results_from_counts(years, counts)
+
+def results_by(cube, dimension):
+    """Результаты по годам для каждого значения измерения, например results_by(cube, 'group')"""
+    return {
+        value: results_from_cube(part)
+        for value, part in cube.groupby(dimension, dropna=False)
+    }
+
+def count_chunk(df, cache_path=None):
+    """Куб одного куска датасета, выполняется в процессах пула"""
+    return build_cube(label_rows(df, open_cache(cache_path)))
+
+def analyze_dataset_chunked(file_path, chunk_size=100_000, workers=None, cache_path=None):
+    """
+    Куб датасета, прочитанного по кускам в пуле процессов. В памяти
+    одновременно не больше двух кусков на процесс, поэтому датасет может не
+    помещаться в память; кубы кусков складываются в общий куб.
+    """
+    chunks = iter_dataset_chunks(file_path, chunk_size)
+    if chunks is None:
+        return None
+    
+    workers = workers or os.cpu_count()
+    cube = merge_cubes([])
+    
+    def merge(futures):
+        nonlocal cube
+        cube = merge_cubes([cube] + [future.result() for future in futures])
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                merge(done)
+            pending.add(pool.submit(count_chunk, chunk, cache_path))
+        merge(wait(pending).done)
+    
+    return cube
+
+def update_result_store(file_path, store, chunk_size=100_000, cache_path=None, dataset=None):
+    """
+    Добавляет в хранилище результатов строки датасета, которых там ещё нет:
+    классифицируются только они. Строки его категорий (и категорий, прежде
+    записанных для dataset), которых в датасете больше нет, удаляются.
+    Возвращает категории датасета, число новых и число удалённых строк.
+    """
+    columns = DATASET_COLUMNS + [c for c in ROW_KEY_COLUMNS if c not in DATASET_COLUMNS]
+    chunks = iter_dataset_chunks(file_path, chunk_size, columns)
+    if chunks is None:
+        return set(), 0, 0
+    
+    store.start_scan()
+    categories = set()
+    added = 0
+    for chunk in chunks:
+        categories.update(chunk['category'].dropna().astype(str).unique())
+        new = chunk[store.new_rows(chunk)].copy()
+        if len(new):
+            store.add_rows(label_rows(new, open_cache(cache_path)))
+            added += len(new)
+    
+    # Сборщик перезаписывает датасет целиком, поэтому пропавшие строки удалены из него
+    previous = store.dataset_categories(dataset) if dataset else []
+    removed = store.remove_unseen_rows(categories | set(previous))
+    return categories, added, removed
+
+def analyze_dataset_cube(file_path, chunk_size=None, workers=None, cache_path=None):
+    """Куб результатов датасета (см. build_cube), None если датасет не прочитан"""
+    if chunk_size:
+        return analyze_dataset_chunked(file_path, chunk_size, workers, cache_path)
+    
+    df = read_dataset(file_path)
+    if df is None:
+        return None
+    
+    return build_cube(label_rows(df, open_cache(cache_path)))
+
+def analyze_dataset(file_path, chunk_size=None, workers=None, cache_path=None):
+    cube = analyze_dataset_cube(file_path, chunk_size, workers, cache_path)
+    if cube is None:
+        return {}
+    return results_from_cube(cube)
+
+def analyze_group(cube, row_type, **filters):
+    """Сводка a/b/c для постов или комментариев среза куба, например analyze_group(cube, 'post', month=5)"""
+    part = slice_cube(cube, type=row_type, **filters)
+    counts = part.groupby('language_category')['count'].sum()
+    return summarize_counts(*(int(counts.get(label, 0)) for label in 'abc'))
+
+def summarize_counts(a_count, b_count, c_count):
+    """Количества и проценты категорий a/b/c"""
+    total = a_count + b_count + c_count
     
     if total == 0:
         return {
@@ -129,12 +465,6 @@ def analyze_group(data):
             'c_count': 0, 'c_percent': 0
         }
     
-    counts = data['language_category'].value_counts()
-    
-    a_count = counts.get('a', 0)
-    b_count = counts.get('b', 0)
-    c_count = counts.get('c', 0)
-    
     return {
         'total': total,
         'a_count': int(a_count),
@@ -167,51 +497,147 @@ def print_results(results, dataset_name):
         print(f"  (b) Тувинский (рус. клавиатура): {c['b_count']} ({c['b_percent']}%)")
         print(f"  (c) Русский: {c['c_count']} ({c['c_percent']}%)")
 
+def summary_row(content_type, d, **columns):
+    """Строка results_*.csv для сводки summarize_counts, перед ней - колонки columns"""
+    return {
+        **columns,
+        'Тип': 'Посты' if content_type == 'posts' else 'Комментарии',
+        'Всего': d['total'],
+        'Тувинский_ңөү_кол': d['a_count'],
+        'Тувинский_ңөү_%': d['a_percent'],
+        'Тувинский_рус_клав_кол': d['b_count'],
+        'Тувинский_рус_клав_%': d['b_percent'],
+        'Русский_кол': d['c_count'],
+        'Русский_%': d['c_percent']
+    }
+
 def export_results_to_csv(results, output_file):
     rows = []
     
     for year, data in results.items():
         for content_type in ['posts', 'comments']:
-            d = data[content_type]
-            rows.append({
-                'Год': year,
-                'Тип': 'Посты' if content_type == 'posts' else 'Комментарии',
-                'Всего': d['total'],
-                'Тувинский_ңөү_кол': d['a_count'],
-                'Тувинский_ңөү_%': d['a_percent'],
-                'Тувинский_рус_клав_кол': d['b_count'],
-                'Тувинский_рус_клав_%': d['b_percent'],
-                'Русский_кол': d['c_count'],
-                'Русский_%': d['c_percent']
-            })
+            rows.append(summary_row(content_type, data[content_type], Год=year))
     
     df_results = pd.DataFrame(rows)
     df_results.to_csv(output_file, index=False, encoding='utf-8-sig')
     print(f"\nРезультаты сохранены в: {output_file}")
 
+def export_groups_to_csv(cube, output_file):
+    """Результаты по годам для каждой группы, из куба"""
+    rows = []
+    for group, results in results_by(cube, 'group').items():
+        for year, data in results.items():
+            for content_type in ['posts', 'comments']:
+                rows.append(summary_row(content_type, data[content_type], Группа=group, Год=year))
+    
+    pd.DataFrame(rows).to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"Результаты по группам сохранены в: {output_file}")
+
+def export_months_to_csv(cube, output_file):
+    """Результаты по месяцам каждого года, срезами куба"""
+    rows = []
+    months = cube[['year', 'month']].dropna().drop_duplicates().sort_values(['year', 'month'])
+    for year, month in months.itertuples(index=False):
+        for content_type, row_type in [('posts', 'post'), ('comments', 'comment')]:
+            summary = analyze_group(cube, row_type, year=year, month=month)
+            rows.append(summary_row(content_type, summary, Год=int(year), Месяц=int(month)))
+    
+    pd.DataFrame(rows).to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"Результаты по месяцам сохранены в: {output_file}")
+
+def export_cube_to_csv(cube, output_file):
+    """Сохраняет куб целиком: срезы по группам и месяцам строятся из него без сырых данных"""
+    cube.rename(columns={'language_category': 'label'}).to_csv(
+        output_file, index=False, encoding='utf-8-sig'
+    )
+    print(f"Куб результатов сохранён в: {output_file}")
+
 if __name__ == "__main__":
-    import os
-    os.makedirs('../dataset/results', exist_ok=True)
+    parser = argparse.ArgumentParser(description="Доля тувинских текстов в датасетах сборщика")
+    parser.add_argument("--chunk-size", type=int, metavar="ROWS",
+                        help="читать датасеты кусками по ROWS строк и обрабатывать их в пуле процессов")
+    parser.add_argument("--workers", type=int, help="процессов пула (по умолчанию по числу ядер)")
+    parser.add_argument("--cache", default=CACHE_FILE, help="файл кэша меток текстов")
+    parser.add_argument("--no-cache", action="store_true", help="классифицировать все тексты заново")
+    parser.add_argument("--incremental", action="store_true",
+                        help="классифицировать только строки, которых нет в хранилище результатов")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="только пересобрать results_*.csv из хранилища результатов")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="очистить хранилище результатов перед --incremental")
+    parser.add_argument("--store", help=f"файл хранилища результатов (по умолчанию {RESULT_STORE_NAME} в --results-dir)")
+    parser.add_argument("--raw-dir", default=RAW_DIR,
+                        help="папка с датасетами сборщика, например ../dataset/sample для выборки по годам")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="папка для results_*.csv, cube_*.csv и дашборда")
+    args = parser.parse_args()
+    cache_path = None if args.no_cache else args.cache
+    
+    store = None
+    if args.incremental or args.regenerate:
+        store = ResultStore(args.store or os.path.join(args.results_dir, RESULT_STORE_NAME), RULES_VERSION)
+        if args.rebuild:
+            store.clear()
     
-    datasets = [
-        '../dataset/raw/official_media_posts.csv',
-        '../dataset/raw/community_media_posts.csv',
-        '../dataset/raw/gov_institutions_posts.csv'
-    ]
+    os.makedirs(args.results_dir, exist_ok=True)
+    
+    datasets = [os.path.join(args.raw_dir, name) for name in DATASET_FILES]
     
     all_results = {}
     
-    for dataset_file in datasets:
+    for dataset_name in datasets:
+        filename = os.path.splitext(os.path.basename(dataset_name))[0]
+        output_file = os.path.join(args.results_dir, f"results_{filename}.csv")
+        cube_file = os.path.join(args.results_dir, f"cube_{filename}.csv")
+        groups_file = os.path.join(args.results_dir, f"groups_{filename}.csv")
+        months_file = os.path.join(args.results_dir, f"months_{filename}.csv")
+        
+        if args.regenerate:
+            categories = store.dataset_categories(filename)
+            if not categories:
+                print(f"\nДатасета {dataset_name} нет в хранилище результатов")
+                continue
+            cube = store.cube(categories)
+            all_results[dataset_name] = results_from_cube(cube)
+            export_results_to_csv(all_results[dataset_name], output_file)
+            export_cube_to_csv(cube, cube_file)
+            export_groups_to_csv(cube, groups_file)
+            export_months_to_csv(cube, months_file)
+            continue
+        
+        # Датасет может быть сохранён в любом формате сборщика
+        dataset_file = find_raw_dataset(dataset_name)
+        if dataset_file is None:
+            print(f"\nДатасет {dataset_name} не найден")
+            continue
+        
         print(f"\nОбработка {dataset_file}...")
         
-        results = analyze_dataset(dataset_file)
+        if args.incremental:
+            categories, added, removed = update_result_store(
+                dataset_file, store, args.chunk_size or 100_000, cache_path, filename
+            )
+            store.set_dataset_categories(filename, categories)
+            print(f"Новых строк: {added}, удалённых: {removed}")
+            cube = store.cube(categories)
+        else:
+            cube = analyze_dataset_cube(dataset_file, args.chunk_size, args.workers, cache_path)
+            if cube is None:
+                continue
         
+        results = results_from_cube(cube)
         all_results[dataset_file] = results
         print_results(results, dataset_file)
         
-        filename = dataset_file.split('/')[-1].replace('.csv', '')
-        output_file = f"../dataset/results/results_{filename}.csv"
         export_results_to_csv(results, output_file)
+        export_cube_to_csv(cube, cube_file)
+        export_groups_to_csv(cube, groups_file)
+        export_months_to_csv(cube, months_file)
+    
+    if store is not None:
+        store.close()
+    
+    # Все источники одним файлом для дашборда
+    write_bundle(args.results_dir, os.path.join(args.results_dir, 'results_bundle.json'))
     
     print("\n" + "="*60)
     print("АНАЛИЗ ЗАВЕРШЁН")